@@ -1,6 +1,10 @@
 import os
+import numpy
 import pandas
 
+# A well-formed SIREN or SIRET number, as siret_processor.SIRET_PATTERN
+SIRET_PATTERN = r'\d{9}|\d{14}'
+
 def client_csv_maker(db, good_siret_client, bad_siret_client, duplicate_siret_client):
     """
     @brief Creates CSV files for client data based on SIRET validity.
@@ -95,3 +99,110 @@ class csv_maker:
                 return
             else:
                 self.db[self.db['CT_Siret'].isin([siret])].to_csv('client_duplicate_siret.csv', mode='a', index=False, header=False)
+
+
+class csv_writer:
+    """
+    @brief An append-only writer for the client SIRET CSV files.
+
+    Unlike csv_maker, the files stay open for the whole run and the rows
+    already written to each file are tracked in a set, so every batch costs
+    one pass over its own rows instead of a read of the whole output file
+    per SIRET number.
+
+    Good and duplicate rows are tracked by SIRET number, and only when it is
+    well-formed. Bad rows have no usable SIRET, mostly an empty one, so they
+    are tracked by database and CT_Num: every bad row of every database is
+    written once.
+    """
+
+    files = {
+        'good': 'client_good_siret.csv',
+        'bad': 'client_bad_siret.csv',
+        'duplicate': 'client_duplicate_siret.csv',
+    }
+    header = ['CT_Siret', 'CT_Num', 'CT_Intitule', 'DB_Name']
+    # Positions of the columns the rows of each category are tracked by
+    keys = {
+        'good': [0],
+        'duplicate': [0],
+        'bad': [3, 1],
+    }
+
+    def __init__(self, resume=False):
+        """
+        @brief Opens the three CSV files for appending.
+
+        @param resume If True, the rows of the existing files are read once to
+                      rebuild the seen-index, and later batches skip them.
+                      Otherwise the files are expected to be new or empty.
+        """
+        self.seen = {category: set() for category in self.files}
+        self._files = {}
+        for category, path in self.files.items():
+            exists = os.path.isfile(path) and os.path.getsize(path) > 0
+            if resume and exists:
+                existing_data = pandas.read_csv(path, dtype=str, keep_default_na=False)
+                keys, tracked = self._row_keys(category, existing_data)
+                self.seen[category].update(keys[tracked])
+            self._files[category] = open(path, mode='a', newline='', encoding='utf-8')
+            if not exists:
+                self._files[category].write(','.join(self.header) + '\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _row_keys(self, category, rows):
+        """
+        @brief The keys the rows of a category are tracked by.
+
+        @return The keys, a Series of strings, and a boolean array of the rows
+                that are tracked: every row in bad, the well-formed SIRET numbers otherwise.
+        """
+        columns = rows.iloc[:, self.keys[category]].fillna('').astype(str)
+        keys = columns.iloc[:, 0]
+        for position in range(1, columns.shape[1]):
+            keys = keys + '\x1f' + columns.iloc[:, position]
+        if category == 'bad':
+            return keys, numpy.ones(len(keys), dtype=bool)
+        return keys, keys.str.fullmatch(SIRET_PATTERN).to_numpy()
+
+    def write_rows(self, category, rows):
+        """
+        @brief Appends a batch of client rows, skipping the rows already in the file.
+
+        @param category 'good', 'bad' or 'duplicate'.
+        @param rows A DataFrame with the CT_Siret, CT_Num, CT_Intitule and database name columns, in that order.
+
+        @return The number of rows written.
+        """
+        seen = self.seen[category]
+        keys, tracked = self._row_keys(category, rows)
+        new = ~(tracked & keys.isin(seen).to_numpy())
+        if new.any():
+            rows[new].to_csv(self._files[category], index=False, header=False)
+            seen.update(keys[new & tracked])
+        return int(new.sum())
+
+    def write_sirets(self, category, db, sirets):
+        """
+        @brief Appends every row of `db` holding one of the SIRET numbers, as csv_maker does one number at a time.
+
+        @param db The DataFrame containing client information.
+        @param sirets The SIRET numbers of the batch.
+
+        @return The number of rows written.
+        """
+        return self.write_rows(category, db[db.iloc[:, 0].isin(sirets)])
+
+    def flush(self):
+        for df in self._files.values():
+            df.flush()
+
+    def close(self):
+        for df in self._files.values():
+            df.close()
+
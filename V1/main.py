@@ -4,7 +4,7 @@ import os
 from dotenv import load_dotenv
 import threading
 import json
-from client_csv_maker import csv_maker
+from client_csv_maker import csv_writer
 from tqdm import tqdm
 import json
 
@@ -15,8 +15,15 @@ def process_data(db_name, results : list):
 
     Args:
         db_name (str): The name of the database from which to fetch SIRET data.
+        results (list): The list the processing result of the database is appended to.
     """
-    
+    df = get_siret_data(db_name)
+    if df is None:
+        return
+    result = SiretProcessor().process_sirets(df, db_name)
+    # Client rows of the database, written by main
+    result["data"] = df
+    results.append(result)
 
 def main():
     """
@@ -51,26 +58,20 @@ def main():
     for thread in threads:
         thread.join()
 
-    for result, db_name in tqdm(zip(results, databases), total=len(results), desc="Processing databases"):
-        result["db_name"] = db_name
-        print(f"DB[{result['db_name']}]")
-        if 'counts' in result:  # Check if 'counts' exists
-            print(f"counts:\ngood[{result['counts']['good']}]\nduplicate[{result['counts']['duplicate']}]\nbad[{result['counts']['bad']}]")
-        else:
-            print("counts data not found for this database.")
-        csv = csv_maker(db_name)
-
-        # Process good customers
-        for customer in tqdm(result['customers']['good'], desc="Processing good customers", leave=False):
-            csv.write_good_csv(customer)
-
-        # Process duplicate customers
-        for customer in tqdm(result['customers']['duplicate'], desc="Processing duplicate customers", leave=False):
-            csv.write_duplicate_csv(customer)
-
-        # Process bad customers
-        for customer in tqdm(result['customers']['bad'], desc="Processing bad customers", leave=False):
-            csv.write_bad_csv(customer)
+    # Threads append their result as they finish, in any order
+    with csv_writer() as csv:
+        for result in tqdm(results, total=len(results), desc="Processing databases"):
+            db_name = result["db_name"]
+            print(f"DB[{result['db_name']}]")
+            if 'counts' in result:  # Check if 'counts' exists
+                print(f"counts:\ngood[{result['counts']['good']}]\nduplicate[{result['counts']['duplicate']}]\nbad[{result['counts']['bad']}]")
+            else:
+                print("counts data not found for this database.")
+
+            # One batch per category of the database
+            csv.write_sirets('good', result['data'], result['customers']['good'])
+            csv.write_sirets('duplicate', result['data'], result['customers']['duplicate'])
+            csv.write_sirets('bad', result['data'], result['customers']['bad'])
 
     # Writing final stats to JSON
     with open("final.json", 'w') as json_file:
@@ -1,27 +1,92 @@
 from db import get_db
+from collections.abc import Mapping
+from itertools import islice
 import re
+import time
+
+
+SIRET_PATTERN = re.compile(r'^\d{9}$|^\d{14}$')
+
+
+def iter_batches(rows, batch_size, column='CT_Siret'):
+    """
+    Reads SIRET numbers from any row source, one batch at a time.
+
+    Args:
+        rows: A DataFrame, an object with a DB-API `fetchmany` (a pyodbc cursor),
+            or any iterable of rows (a csv.reader / csv.DictReader, a list...).
+        batch_size (int): The number of SIRET numbers per batch.
+        column (str): The SIRET column of DataFrames and dict rows. Other rows
+            are either the SIRET itself or a sequence starting with it, as in
+            the V1 query.
+
+    Yields:
+        list: The SIRET numbers of the next batch.
+    """
+    if hasattr(rows, 'columns'):
+        values = rows[column]
+        for start in range(0, len(values), batch_size):
+            yield values.iloc[start:start + batch_size].tolist()
+        return
+    if hasattr(rows, 'fetchmany'):
+        batches = iter(lambda: rows.fetchmany(batch_size), [])
+    else:
+        iterator = iter(rows)
+        batches = iter(lambda: list(islice(iterator, batch_size)), [])
+    for batch in batches:
+        yield [row if row is None or isinstance(row, str)
+               else row[column] if isinstance(row, Mapping)
+               else row[0]
+               for row in batch]
 
 
 class SiretProcessor:
     """
     A class for processing SIRET numbers.
 
-    This class is responsible for validating SIRET numbers, categorizing them, 
-    and writing the results to CSV files.
+    This class is responsible for validating SIRET numbers and categorizing them.
+    Rows are consumed in batches from any source and the valid SIRET numbers
+    already seen are kept in a set, so a run is linear in the number of rows.
     """
 
-    def __init__(self):
+    def __init__(self, batch_size=10000, progress=None, progress_interval=0.5):
         """
         Initializes the SiretProcessor.
 
-        Sets up lists to store valid, invalid, duplicate, and empty SIRET numbers,
-        and initializes a CSV maker for output.
+        Args:
+            batch_size (int): The number of rows read from the source at once.
+            progress (callable): Called with the statistics dict of process_siret,
+                at most every `progress_interval` seconds and once at the end.
+            progress_interval (float): The minimum number of seconds between two progress calls.
+        """
+        self.batch_size = batch_size
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.true_siret = set()
+        self.counts = {"Valid": 0, "Invalid": 0, "Duplicate": 0, "Empty": 0}
+
+    def classify(self, siret):
         """
-        self.true_siret = []
-        self.false_siret = []
-        self.duplicate_siret = []
-        self.empty_siret = []
-        self.csv_maker = None
+        Validates a single SIRET number and records it.
+
+        Args:
+            siret (str): The SIRET number to process.
+
+        Returns:
+            str: The result, "✓ Valid", "⚠ Duplicate", "✗ Invalid" or "⚠ Empty".
+        """
+        if not siret or siret.strip() == "":
+            self.counts["Empty"] += 1
+            return "⚠ Empty"
+        if not SIRET_PATTERN.match(siret):
+            self.counts["Invalid"] += 1
+            return "✗ Invalid"
+        if siret in self.true_siret:
+            self.counts["Duplicate"] += 1
+            return "⚠ Duplicate"
+        self.true_siret.add(siret)
+        self.counts["Valid"] += 1
+        return "✓ Valid"
 
     def process_siret(self, siret, index, total_count):
         """
@@ -35,44 +100,23 @@ class SiretProcessor:
         Returns:
             dict: A dictionary containing the processing result and statistics.
         """
-        result = None
-        if not siret or siret.strip() == "":
-            self.empty_siret.append(siret)
-            result = "⚠ Empty"
-        else:
-            if not re.match(r'^\d{9}$|^\d{14}$', siret):
-                self.false_siret.append(siret)
-                result = "✗ Invalid"
-            else:
-                if siret not in self.true_siret:
-                    self.true_siret.append(siret)
-                    result = "✓ Valid"
-                else:
-                    self.duplicate_siret.append(siret)
-                    result = "⚠ Duplicate"
-        return {
-            "item": siret,
-            "result": result,
-            "processed": index + 1,
-            "total": total_count,
-            "categories": {
-                "Valid": len(self.true_siret),
-                "Invalid": len(self.false_siret),
-                "Duplicate": len(self.duplicate_siret),
-                "Empty": len(self.empty_siret),
-            },
-        }
+        return self._stats(siret, self.classify(siret), index + 1, total_count)
 
-    def process_sirets(self, df):
+    def process_sirets(self, rows, db_name=None, total_count=None):
         """
-        Processes a DataFrame of SIRET numbers.
+        Processes SIRET numbers from a DataFrame, a CSV reader or a DB cursor.
 
         Args:
-            df (DataFrame): The DataFrame containing SIRET numbers to process.
+            rows: The row source, see iter_batches.
+            db_name (str): The name of the database the rows come from.
+            total_count (int): The number of rows, reported to the progress
+                callback. Defaults to len(rows) when the source has one.
 
-        This method processes SIRET numbers in parallel and updates progress.
+        Returns:
+            dict: The database name, the counts and the SIRET numbers of every category.
         """
-        total_count = len(df)
+        if total_count is None and hasattr(rows, '__len__'):
+            total_count = len(rows)
         counter = {
             "bad" : 0,
             "good" : 0,
@@ -83,26 +127,39 @@ class SiretProcessor:
             'bad' : [],
             'duplicate' : [],
         }
+        category = {"✓ Valid": "good", "⚠ Duplicate": "duplicate", "✗ Invalid": "bad", "⚠ Empty": "bad"}
+
+        processed = 0
+        siret = result = None
+        last_report = time.monotonic()
+        for batch in iter_batches(rows, self.batch_size):
+            for siret in batch:
+                result = self.classify(siret)
+                customers[category[result]].append(siret)
+            processed += len(batch)
+            if self.progress is not None and time.monotonic() - last_report >= self.progress_interval:
+                self.progress(self._stats(siret, result, processed, total_count))
+                last_report = time.monotonic()
+        if self.progress is not None:
+            self.progress(self._stats(siret, result, processed, total_count))
 
-        for index, row in df.iterrows():
-            siret = row['CT_Siret']
-            customer = self.process_siret(siret, index, total_count)
-            print(f"{index + 1}/{total_count} | result = {customer['result']} | siret: {customer['item'] if customer['item'] != '' else 'None'}")
-            if customer["result"] == "⚠ Empty" or customer["result"] == "✗ Invalid":
-                counter["bad"] += 1
-                customers["bad"].append(customer["item"])
-            elif customer["result"] == "✓ Valid":
-                counter["good"] += 1
-                customers["good"].append(customer["item"])
-            elif customer["result"] == "⚠ Duplicate":
-                counter["duplicate"] += 1
-                customers["duplicate"].append(customer["item"])
+        for key, values in customers.items():
+            counter[key] = len(values)
         return {
-            "db_name": df['DB_Name'],
+            "db_name": db_name,
             "counts": counter,
             "customers": customers,
         }
 
+    def _stats(self, siret, result, processed, total_count):
+        return {
+            "item": siret,
+            "result": result,
+            "processed": processed,
+            "total": total_count,
+            "categories": dict(self.counts),
+        }
+
 def get_siret_data(db_name):
     """
     Fetches SIRET data from the specified database.
@@ -0,0 +1,327 @@
+import json
+import os
+import random
+import time
+from collections.abc import Sequence
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import CountVectorizer
+from fuzzywuzzy import fuzz
+
+
+def char_bigrams(name):
+    """Raw, case-sensitive character bigrams, the same windows as nltk.ngrams(name, 2)."""
+    return [name[i:i + 2] for i in range(len(name) - 1)]
+
+def chars(name):
+    """Single characters, the tokens of textdistance.jaccard with its default qval=1."""
+    return list(name)
+
+def _threshold_encode(counts, width):
+    """
+    Expand a count matrix into a binary one with a column per (feature, k) for k < count.
+
+    Two encoded rows share exactly min(count_a, count_b) columns per feature, so
+    their product is the size of the multiset intersection.
+    """
+    counts = counts.tocsr()
+    repeats = counts.data.astype(np.int64)
+    rows = np.repeat(np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr)), repeats)
+    starts = np.repeat(np.cumsum(repeats) - repeats, repeats)
+    levels = np.arange(repeats.sum()) - starts
+    cols = np.repeat(counts.indices.astype(np.int64), repeats) * width + levels
+    data = np.ones(len(cols), dtype=np.int32)
+    return sp.csr_matrix((data, (rows, cols)), shape=(counts.shape[0], counts.shape[1] * width))
+
+def _value_encode(counts, width):
+    """
+    Re-key a count matrix on (feature, count): two encoded rows share a column
+    only where both have the feature with the same count.
+    """
+    counts = counts.tocsr()
+    rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+    cols = counts.indices.astype(np.int64) * width + counts.data - 1
+    data = np.ones(counts.nnz, dtype=np.int32)
+    return sp.csr_matrix((data, (rows, cols)), shape=(counts.shape[0], counts.shape[1] * width))
+
+def _ratio(numerator, denominator, empty):
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    out = np.full(np.broadcast(numerator, denominator).shape, float(empty))
+    np.divide(numerator, denominator, out=out, where=denominator > 0)
+    return out
+
+def _rowwise_dot(a, b):
+    return np.asarray(a.multiply(b).sum(axis=1)).ravel()
+
+def _cross_dot(a, b):
+    return (a @ b.T).toarray()
+
+def _save_parts(path, prefix, part):
+    """
+    Saves the arrays and CSR matrices of a scorer part as .npy files named
+    after `prefix` and the attribute, and returns the JSON description
+    _attach_part needs to map them back.
+    """
+    meta = {}
+    for name, value in vars(part).items():
+        if sp.issparse(value):
+            value.sort_indices()
+            for field in ('data', 'indices', 'indptr'):
+                np.save(os.path.join(path, f'{prefix}.{name}.{field}.npy'), getattr(value, field))
+            meta[name] = {'csr': list(value.shape)}
+        elif isinstance(value, np.ndarray):
+            np.save(os.path.join(path, f'{prefix}.{name}.npy'), value)
+            meta[name] = {'array': True}
+        else:
+            meta[name] = {'value': value}
+    return meta
+
+def _attach_part(path, prefix, cls, meta):
+    """A scorer part of class `cls` whose arrays are mapped read-only from the files of _save_parts."""
+    def load(name):
+        return np.load(os.path.join(path, f'{prefix}.{name}.npy'), mmap_mode='r')
+    part = cls.__new__(cls)
+    for name, kind in meta.items():
+        if 'csr' in kind:
+            matrix = sp.csr_matrix((load(f'{name}.data'), load(f'{name}.indices'), load(f'{name}.indptr')),
+                                   shape=tuple(kind['csr']), copy=False)
+            matrix.has_sorted_indices = True
+            setattr(part, name, matrix)
+        elif 'array' in kind:
+            setattr(part, name, load(name))
+        else:
+            setattr(part, name, kind['value'])
+    return part
+
+
+class _MultisetJaccard:
+    """
+    sum(min) / sum(max) over token counts, as Counter & / Counter | in my_ngram
+    and textdistance.jaccard in the_lengther.
+    """
+
+    def __init__(self, analyzer, names, split, empty):
+        counts = CountVectorizer(analyzer=analyzer, lowercase=False).fit_transform(names)
+        width = int(counts.max()) if counts.nnz else 1
+        encoded = _threshold_encode(counts, width)
+        totals = np.asarray(counts.sum(axis=1)).ravel()
+        self.good, self.bad = encoded[:split], encoded[split:]
+        self.good_totals, self.bad_totals = totals[:split], totals[split:]
+        self.empty = empty
+
+    def pairs(self, good_ids, bad_ids):
+        inter = _rowwise_dot(self.good[good_ids], self.bad[bad_ids])
+        union = self.good_totals[good_ids] + self.bad_totals[bad_ids] - inter
+        return _ratio(inter, union, self.empty)
+
+    def block(self, good_ids, bad_ids):
+        inter = _cross_dot(self.good[good_ids], self.bad[bad_ids])
+        union = self.good_totals[good_ids][:, None] + self.bad_totals[bad_ids][None, :] - inter
+        return _ratio(inter, union, self.empty)
+
+
+class _SetJaccard:
+    """|A & B| / |A | B| over distinct tokens, the cheap first stage of the cascade."""
+
+    def __init__(self, analyzer, names, split):
+        support = CountVectorizer(analyzer=analyzer, lowercase=False, binary=True).fit_transform(names)
+        support = support.astype(np.int32).tocsr()
+        sizes = np.diff(support.indptr)
+        self.good, self.bad = support[:split], support[split:]
+        self.good_sizes, self.bad_sizes = sizes[:split], sizes[split:]
+
+    def pairs(self, good_ids, bad_ids):
+        inter = _rowwise_dot(self.good[good_ids], self.bad[bad_ids])
+        union = self.good_sizes[good_ids] + self.bad_sizes[bad_ids] - inter
+        return _ratio(inter, union, 0.0)
+
+
+class _CountVectorJaccard:
+    """
+    jaccard_score(X[0], X[1], average="micro") on the CountVectorizer rows of a pair,
+    as in skibidi_learn.
+
+    Over the pair's vocabulary (the union of both supports) the counts are
+    compared as labels: with `equal` positions where both counts match, the
+    micro score is equal / (equal + 2 * (union - equal)).
+    """
+
+    def __init__(self, names, split):
+        counts = CountVectorizer(analyzer='char', ngram_range=(2, 2)).fit_transform(names)
+        width = int(counts.max()) if counts.nnz else 1
+        support = (counts > 0).astype(np.int32).tocsr()
+        values = _value_encode(counts, width)
+        sizes = np.diff(support.indptr)
+        self.good_support, self.bad_support = support[:split], support[split:]
+        self.good_values, self.bad_values = values[:split], values[split:]
+        self.good_sizes, self.bad_sizes = sizes[:split], sizes[split:]
+
+    def _score(self, shared, equal, good_sizes, bad_sizes):
+        union = good_sizes + bad_sizes - shared
+        return _ratio(equal, 2 * union - equal, 0.0)
+
+    def pairs(self, good_ids, bad_ids):
+        shared = _rowwise_dot(self.good_support[good_ids], self.bad_support[bad_ids])
+        equal = _rowwise_dot(self.good_values[good_ids], self.bad_values[bad_ids])
+        return self._score(shared, equal, self.good_sizes[good_ids], self.bad_sizes[bad_ids])
+
+    def block(self, good_ids, bad_ids):
+        shared = _cross_dot(self.good_support[good_ids], self.bad_support[bad_ids])
+        equal = _cross_dot(self.good_values[good_ids], self.bad_values[bad_ids])
+        return self._score(shared, equal,
+                           self.good_sizes[good_ids][:, None], self.bad_sizes[bad_ids][None, :])
+
+
+class BatchScorer:
+    """
+    Batch version of the enterprise_finder scorers.
+
+    Every good and bad name is vectorized once, with one vocabulary shared by
+    both sides, and whole blocks of pairs are scored with sparse matrix
+    products instead of one CountVectorizer fit per pair:
+
+    - ngram    : my_ngram, multiset Jaccard of raw character bigrams
+    - skibidi  : skibidi_learn, micro Jaccard of lowercased bigram count vectors
+    - fuzz     : the_fuzzz, still one fuzz.ratio call per pair (edit distance has no sparse form)
+    - lengther : the_lengther, multiset Jaccard of characters
+
+    Names are addressed by their position in `good_names` / `bad_names`,
+    any sequence, such as the names of a NameStore, kept as given.
+    save() writes the vectorized names as .npy files and attach() maps them
+    read-only, so process workers share one copy instead of each fitting its own.
+    Where a name has no bigram at all the reference skibidi_learn raises on an
+    empty vocabulary; the batch engine scores it 0.
+    """
+
+    def __init__(self, good_names, bad_names):
+        self.good_names = good_names if isinstance(good_names, Sequence) else list(good_names)
+        self.bad_names = bad_names if isinstance(bad_names, Sequence) else list(bad_names)
+        names = list(self.good_names) + list(self.bad_names)
+        split = len(self.good_names)
+        self._ngram = _MultisetJaccard(char_bigrams, names, split, empty=0.0)
+        self._skibidi = _CountVectorJaccard(names, split)
+        self._lengther = _MultisetJaccard(chars, names, split, empty=1.0)
+        self._set_bigrams = _SetJaccard(char_bigrams, names, split)
+
+    PARTS = {'_ngram': _MultisetJaccard, '_skibidi': _CountVectorJaccard,
+             '_lengther': _MultisetJaccard, '_set_bigrams': _SetJaccard}
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        meta = {name: _save_parts(path, name.lstrip('_'), getattr(self, name)) for name in self.PARTS}
+        with open(os.path.join(path, 'scorer.json'), 'w') as meta_file:
+            json.dump(meta, meta_file)
+
+    @classmethod
+    def attach(cls, path, good_names, bad_names):
+        """
+        @brief A BatchScorer mapping the matrices saved at `path` instead of vectorizing the names again.
+
+        @param good_names The good names the scorer was saved with, still needed by fuzz.ratio.
+        @param bad_names The bad names the scorer was saved with.
+        """
+        with open(os.path.join(path, 'scorer.json')) as meta_file:
+            meta = json.load(meta_file)
+        scorer = cls.__new__(cls)
+        scorer.good_names = good_names if isinstance(good_names, Sequence) else list(good_names)
+        scorer.bad_names = bad_names if isinstance(bad_names, Sequence) else list(bad_names)
+        for name, part in cls.PARTS.items():
+            setattr(scorer, name, _attach_part(path, name.lstrip('_'), part, meta[name]))
+        return scorer
+
+    def set_jaccard_pairs(self, good_ids, bad_ids):
+        """
+        @brief Jaccard of the distinct raw bigram sets of aligned pairs, as brut_force in name_finder.
+
+        @return A 1-D array of scores.
+        """
+        good_ids = np.asarray(good_ids, dtype=np.int64)
+        bad_ids = np.asarray(bad_ids, dtype=np.int64)
+        return self._set_bigrams.pairs(good_ids, bad_ids)
+
+    def score_pairs(self, good_ids, bad_ids, counts=None):
+        """
+        @brief Scores aligned pairs (good_ids[i], bad_ids[i]).
+
+        @param counts A Counter the pairs and time of every scorer are added to,
+                      as `calls:batch_<scorer>` and `seconds:batch_<scorer>`.
+
+        @return A dict of 1-D arrays: 'ngram', 'skibidi', 'fuzz', 'lengther' and their average 'moyenne'.
+        """
+        good_ids = np.asarray(good_ids, dtype=np.int64)
+        bad_ids = np.asarray(bad_ids, dtype=np.int64)
+        scorers = {
+            'ngram': lambda: self._ngram.pairs(good_ids, bad_ids),
+            'skibidi': lambda: self._skibidi.pairs(good_ids, bad_ids),
+            'fuzz': lambda: np.array([fuzz.ratio(self.good_names[g], self.bad_names[b]) / 100
+                                      for g, b in zip(good_ids, bad_ids)], dtype=np.float64),
+            'lengther': lambda: self._lengther.pairs(good_ids, bad_ids),
+        }
+        scores = {}
+        for name, scorer in scorers.items():
+            start = time.perf_counter()
+            scores[name] = scorer()
+            if counts is not None:
+                counts[f'seconds:batch_{name}'] += time.perf_counter() - start
+                counts[f'calls:batch_{name}'] += len(good_ids)
+        scores['moyenne'] = (scores['ngram'] + scores['skibidi'] + scores['fuzz'] + scores['lengther']) / 4
+        return scores
+
+    def score_block(self, good_ids, bad_ids):
+        """
+        @brief Scores every good x bad pair of the block.
+
+        @return A dict of 2-D arrays shaped (len(good_ids), len(bad_ids)), keyed as score_pairs.
+        """
+        good_ids = np.asarray(good_ids, dtype=np.int64)
+        bad_ids = np.asarray(bad_ids, dtype=np.int64)
+        scores = {
+            'ngram': self._ngram.block(good_ids, bad_ids),
+            'skibidi': self._skibidi.block(good_ids, bad_ids),
+            'fuzz': np.array([[fuzz.ratio(self.good_names[g], self.bad_names[b]) / 100 for b in bad_ids]
+                              for g in good_ids], dtype=np.float64).reshape(len(good_ids), len(bad_ids)),
+            'lengther': self._lengther.block(good_ids, bad_ids),
+        }
+        scores['moyenne'] = (scores['ngram'] + scores['skibidi'] + scores['fuzz'] + scores['lengther']) / 4
+        return scores
+
+
+# Largest gap allowed between the batch engine and the per-pair reference scorers
+TOLERANCE = 1e-12
+
+def compare_with_reference(good_names, bad_names, sample=2000, seed=0):
+    """
+    @brief Scores a random sample of pairs with both engines and returns the largest gap per scorer.
+
+    The per-pair functions of enterprise_finder are the reference implementation;
+    every gap should be at floating point noise level.
+    """
+    from enterprise_finder import my_ngram, skibidi_learn, the_fuzzz, the_lengther
+
+    rng = random.Random(seed)
+    good_ids = [rng.randrange(len(good_names)) for _ in range(sample)]
+    bad_ids = [rng.randrange(len(bad_names)) for _ in range(sample)]
+    engine = BatchScorer(good_names, bad_names)
+    batch = engine.score_pairs(good_ids, bad_ids)
+    reference = {'ngram': my_ngram, 'skibidi': skibidi_learn, 'fuzz': the_fuzzz, 'lengther': the_lengther}
+    gaps = {}
+    for key, scorer in reference.items():
+        expected = [scorer(good_names[g], bad_names[b]) for g, b in zip(good_ids, bad_ids)]
+        gaps[key] = float(np.max(np.abs(batch[key] - np.asarray(expected))))
+    block = engine.score_block(good_ids[:50], bad_ids[:50])
+    gaps['block'] = float(np.max(np.abs(np.diag(block['moyenne']) - batch['moyenne'][:50])))
+    return gaps
+
+
+if __name__ == "__main__":
+    good = pd.read_csv('client_good_siret.csv')['CT_Intitule'].astype(str).tolist()
+    bad = pd.read_csv('client_bad_siret.csv')['CT_Intitule'].astype(str).tolist()
+    failed = False
+    for scorer, gap in compare_with_reference(good, bad).items():
+        print(f"{scorer}: max gap {gap:.2e}")
+        failed |= gap > TOLERANCE
+    if failed:
+        print(f"ERROR: The batch engine is more than {TOLERANCE:g} away from the reference scorers.")
+        exit(84)
@@ -0,0 +1,122 @@
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from prettytable import PrettyTable
+from name_store import NameStore
+from phonetic_blocking import PhoneticIndex
+from minhash_lsh import MinHashIndex
+from synthetic_data import generate
+
+COLUMNS = ['CT_Siret', 'CT_Num', 'CT_Intitule', 'DB_NAME']
+
+
+def truth_pairs(good, bad, truth):
+    """(bad_id, good_id) row positions of the synthetic_truth.csv pairs: every bad row and the good row it misspells."""
+    good_ids = pd.Series(np.arange(len(good)), index=good['CT_Num'])
+    bad_ids = pd.Series(np.arange(len(bad)), index=bad['CT_Num'])
+    return bad_ids[truth['CT_Num_Bad']].to_numpy(), good_ids[truth['CT_Num_Good']].to_numpy()
+
+def one_by_one(candidates):
+    """A batch query from a candidate generator of one name."""
+    return lambda names: [candidates(name) for name in names]
+
+def measure(query, bad_names, bad_ids, truth, batch_size=256):
+    """
+    @brief Runs a batch candidate query over the given bad rows, `batch_size` names at a time.
+
+    @return The pairs it generated, and the share of the true (bad, good)
+            pairs of these rows found among them.
+    """
+    true_goods = {}
+    for bad_id, good_id in zip(*truth):
+        true_goods.setdefault(bad_id, []).append(good_id)
+    pairs = found = expected = 0
+    results = (found_ids
+               for start in range(0, len(bad_ids), batch_size)
+               for found_ids in query([bad_names[bad_id] for bad_id in bad_ids[start:start + batch_size]]))
+    for bad_id, found_ids in zip(bad_ids, results):
+        pairs += len(found_ids)
+        expected_ids = true_goods.get(bad_id, ())
+        if expected_ids:
+            found_ids = set(found_ids)
+            found += sum(good_id in found_ids for good_id in expected_ids)
+            expected += len(expected_ids)
+    return pairs, found / expected if expected else None
+
+def benchmark(good, bad, truth, min_shared=(2, 3, 4), distances=(0, 1), lsh=((16, 4), (32, 3), (64, 2)),
+              sample=1.0, seed=0):
+    """
+    @brief Candidate recall against pairs to score for every blocking of enterprise_finder.
+
+    @return One dict per blocking: index build and query seconds, pairs, share of
+            the cartesian product and recall of the true pairs.
+    """
+    rng = np.random.default_rng(seed)
+    bad_ids = np.flatnonzero(rng.random(len(bad)) < sample)
+    bad_names = bad['CT_Intitule'].astype(str).tolist()
+    start = time.perf_counter()
+    store = NameStore.build(good, COLUMNS)
+    store_seconds = time.perf_counter() - start
+    blockings = [(f"bigram, min-shared {shared}", store_seconds,
+                  one_by_one(lambda name, shared=shared: store.candidates(name, shared))) for shared in min_shared]
+    for distance in distances:
+        start = time.perf_counter()
+        index = PhoneticIndex(store, distance)
+        blockings.append((f"phonetic, distance {distance}", store_seconds + time.perf_counter() - start,
+                          one_by_one(index.candidates)))
+    for bands, rows in lsh:
+        start = time.perf_counter()
+        index = MinHashIndex.build(store, bands, rows)
+        blockings.append((f"minhash, {bands} bands x {rows} rows", store_seconds + time.perf_counter() - start,
+                          index.query))
+    results = []
+    for name, build_seconds, query in blockings:
+        start = time.perf_counter()
+        pairs, recall = measure(query, bad_names, bad_ids, truth)
+        results.append({
+            'blocking': name,
+            'build_seconds': build_seconds,
+            'query_seconds': time.perf_counter() - start,
+            'pairs': pairs,
+            'pair_share': pairs / (len(good) * len(bad_ids)) if len(good) and len(bad_ids) else 0.0,
+            'recall': recall,
+        })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Candidate recall vs pairs scored of the enterprise_finder "
+                                                 "blockings, on synthetic misspelling data.")
+    parser.add_argument("--data", default=None,
+                        help="directory of synthetic_data.py files to use, generated in a temporary directory otherwise")
+    parser.add_argument("--rows", type=int, default=40000, help="rows of the generated client files")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sample", type=float, default=1.0, help="share of the bad rows queried")
+    parser.add_argument("--min-shared", type=int, nargs="+", default=[2, 3, 4])
+    parser.add_argument("--lsh", type=int, nargs=2, action="append", metavar=("BANDS", "ROWS"),
+                        help="MinHash LSH setting to evaluate, can be repeated")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        data = args.data
+        if data is None:
+            generate(output_dir, args.rows, args.seed)
+            data = output_dir
+        good = pd.read_csv(os.path.join(data, 'client_good_siret.csv'), dtype=str)
+        bad = pd.read_csv(os.path.join(data, 'client_bad_siret.csv'), dtype=str)
+        truth = truth_pairs(good, bad, pd.read_csv(os.path.join(data, 'synthetic_truth.csv'), dtype=str))
+    lsh = args.lsh or [(16, 4), (32, 3), (64, 2)]
+    results = benchmark(good, bad, truth, args.min_shared, lsh=lsh, sample=args.sample, seed=args.seed)
+
+    table = PrettyTable()
+    table.field_names = ["Blocking", "Build (s)", "Query (s)", "Pairs", "Share of cartesian", "Recall"]
+    for row in results:
+        table.add_row([row['blocking'], f"{row['build_seconds']:.2f}", f"{row['query_seconds']:.2f}",
+                       f"{row['pairs']:,}", f"{row['pair_share']:.3%}",
+                       f"{row['recall']:.2%}" if row['recall'] is not None else "-"])
+    print(table)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import random
+import numpy as np
+import pandas as pd
+from collections import Counter
+from prettytable import PrettyTable
+import name_finder
+from batch_scorer import BatchScorer
+from enterprise_finder import categorize
+
+
+def misspell(name):
+    # name_finder misspells lowercase letters, company names are uppercase.
+    return name_finder.length_misspell(name_finder.phonetic_misspell(name.lower())).upper()
+
+def synthetic_pairs(names, count, seed=0):
+    """
+    @brief Builds name_finder-style test pairs from real company names.
+
+    Half of the pairs are a name and its phonetic + length misspelling (true
+    matches), the other half a name and the misspelling of another name.
+
+    @return The good names, the misspelled names and the ground truth of each pair.
+    """
+    random.seed(seed)
+    good, bad, truth = [], [], []
+    for i in range(count):
+        name = random.choice(names)
+        if i % 2:
+            other = random.choice(names)
+            good.append(name)
+            bad.append(misspell(other))
+            truth.append(name == other)
+        else:
+            good.append(name)
+            bad.append(misspell(name))
+            truth.append(True)
+    return good, bad, np.array(truth)
+
+def calibrate(good, bad, truth, bands):
+    """
+    @brief Compares the cascade categorization with the full average for each (low, high) band.
+
+    @return One dict per band: pairs reaching the full stage, agreement with
+            the full average, the category changes and the share of true
+            matches still categorized valid or probable.
+    """
+    scorer = BatchScorer(good, bad)
+    ids = np.arange(len(good))
+    cheap = scorer.set_jaccard_pairs(ids, ids)
+    full = scorer.score_pairs(ids, ids)['moyenne']
+    reference = [categorize(score) for score in full]
+    report = []
+    for low, high in bands:
+        ambiguous = (cheap >= low) & (cheap <= high)
+        cascaded = [categorize(score) for score in np.where(ambiguous, full, cheap)]
+        changes = Counter((before, after) for before, after in zip(reference, cascaded) if before != after)
+        found = np.array([category != 'no_chance' for category in cascaded])
+        report.append({
+            'band': (low, high),
+            'full_stage': float(ambiguous.mean()),
+            'agreement': float(np.mean([a == b for a, b in zip(reference, cascaded)])),
+            'changes': dict(changes),
+            'recall': float(found[truth].mean()) if truth.any() else 0.0,
+        })
+    reference_found = np.array([category != 'no_chance' for category in reference])
+    report.append({
+        'band': None,
+        'full_stage': 1.0,
+        'agreement': 1.0,
+        'changes': {},
+        'recall': float(reference_found[truth].mean()) if truth.any() else 0.0,
+    })
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibration report of the enterprise_finder scoring cascade.")
+    parser.add_argument("--pairs", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--band", type=float, nargs=2, action="append", metavar=("LOW", "HIGH"),
+                        help="cascade band to evaluate, can be repeated")
+    args = parser.parse_args()
+    bands = args.band or [(0.1, 0.5), (0.15, 0.6), (0.2, 0.7), (0.05, 0.8)]
+
+    names = pd.read_csv('client_good_siret.csv')['CT_Intitule'].astype(str).tolist()
+    good, bad, truth = synthetic_pairs(names, args.pairs, args.seed)
+    table = PrettyTable()
+    table.field_names = ["Band", "Full stage", "Agreement", "True match recall", "Category changes"]
+    for row in calibrate(good, bad, truth, bands):
+        band = "full average" if row['band'] is None else f"{row['band'][0]:.2f}-{row['band'][1]:.2f}"
+        changes = ", ".join(f"{before}->{after}: {count}" for (before, after), count in sorted(row['changes'].items()))
+        table.add_row([band, f"{row['full_stage']:.2%}", f"{row['agreement']:.2%}", f"{row['recall']:.2%}", changes])
+    print(table)
+
+if __name__ == "__main__":
+    main()
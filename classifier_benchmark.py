@@ -0,0 +1,106 @@
+import argparse
+import os
+import sys
+import time
+import pandas as pd
+from prettytable import PrettyTable
+from siret_classifier import SiretClassifier
+from snapshot_store import SnapshotStore
+
+
+def load_sirets(scale):
+    """
+    @brief Raw CT_Siret values of the bundled CSV files, repeated `scale` times.
+
+    Repeating the files keeps their mix of good, duplicate and bad values, and
+    turns every copy after the first into duplicates, the worst case of the
+    duplicate marking.
+    """
+    files = ['client_good_siret.csv', 'client_dup_siret.csv', 'client_bad_siret.csv']
+    sirets = pd.concat([pd.read_csv(path, dtype=str, keep_default_na=False)['CT_Siret'] for path in files])
+    return pd.concat([sirets] * scale, ignore_index=True)
+
+def time_classifier(sirets):
+    start = time.perf_counter()
+    labels, _ = SiretClassifier().classify(sirets)
+    return time.perf_counter() - start, labels
+
+def time_sql(sirets):
+    """
+    @brief Times the window-function classification of the delta snapshot, the SQL path run locally on SQLite.
+
+    CT_Num are zero-padded row numbers, so its lowest-CT_Num-is-good rule
+    follows the scan order like the classifier.
+    """
+    store = SnapshotStore(':memory:')
+    width = len(str(len(sirets)))
+    store.apply('BENCH', pd.DataFrame({
+        'CT_Num': [str(i).zfill(width) for i in range(len(sirets))],
+        'CT_Siret': sirets,
+        'CT_Intitule': '',
+        'RowHash': '',
+    }))
+    start = time.perf_counter()
+    classified = store.classified('BENCH')
+    seconds = time.perf_counter() - start
+    store.close()
+    return seconds, classified['Category']
+
+def time_v1(sirets):
+    """Times V1's streaming SiretProcessor, which reports through a progress callback, off here."""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'V1'))
+    from siret_processor import SiretProcessor
+
+    df = pd.DataFrame({'CT_Siret': sirets.to_numpy(), 'DB_Name': 'BENCH'})
+    start = time.perf_counter()
+    SiretProcessor().process_sirets(df)
+    return time.perf_counter() - start
+
+def time_server(db_name, chunksize):
+    """Times the single-scan and local query modes of main.py on a live database."""
+    import main
+
+    timings = {}
+    for mode in ("single", "local"):
+        start = time.perf_counter()
+        for _ in main.iter_filtered_siret(db_name, query_mode=mode, chunksize=chunksize):
+            pass
+        timings[mode] = time.perf_counter() - start
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the SIRET classification paths.")
+    parser.add_argument("--scale", type=int, default=100, help="copies of the bundled CSV files to classify")
+    parser.add_argument("--v1-rows", type=int, default=None,
+                        help="rows given to V1's SiretProcessor, all the rows the other paths classify by default")
+    parser.add_argument("--db", help="also time the server query modes of main.py on this database")
+    parser.add_argument("--chunksize", type=int, default=None)
+    args = parser.parse_args()
+
+    sirets = load_sirets(args.scale)
+    table = PrettyTable()
+    table.field_names = ["Path", "Rows", "Seconds", "Rows/s"]
+
+    def add_row(path, rows, seconds):
+        table.add_row([path, rows, f"{seconds:.3f}", f"{rows / seconds:,.0f}" if seconds else "-"])
+
+    seconds, labels = time_classifier(sirets)
+    add_row("siret_classifier", len(sirets), seconds)
+    seconds, categories = time_sql(sirets)
+    add_row("SQL window query (SQLite)", len(sirets), seconds)
+    try:
+        v1_sirets = sirets[:args.v1_rows]
+        add_row("V1 SiretProcessor", len(v1_sirets), time_v1(v1_sirets))
+    except ImportError as e:
+        print(f"V1 SiretProcessor skipped: {str(e)}")
+    if args.db:
+        for mode, seconds in time_server(args.db, args.chunksize).items():
+            table.add_row([f"main.py --query-mode {mode} ({args.db})", "-", f"{seconds:.3f}", "-"])
+    print(table)
+
+    expected = labels.replace('empty', 'bad').where(sirets.notna(), None)
+    mismatches = int((expected.to_numpy() != categories.to_numpy()).sum())
+    print(f"labels differing from the SQL path: {mismatches}")
+
+if __name__ == "__main__":
+    main()
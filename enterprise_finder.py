@@ -1,12 +1,11 @@
 import pandas as pd
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import time
 from prettytable import PrettyTable
 from tqdm import tqdm
 import random
-import csv
-import gc
-import psutil
+import argparse
+import json
 from nltk import ngrams
 from collections import Counter
 
@@ -34,6 +33,7 @@ def skibidi_learn(valide_name, teste_name):
     return compare_names(valide_name, teste_name)
 
 from fuzzywuzzy import fuzz
+from batch_scorer import BatchScorer
 
 def the_fuzzz(valide_name, teste_name):
     return fuzz.ratio(valide_name, teste_name) / 100
@@ -44,88 +44,634 @@ def the_lengther(valide_name, test_name):
     return textdistance.jaccard(valide_name, test_name)
 
 
-def monitor_memory(threshold=0.7):
-    while True:
-        mem = psutil.virtual_memory()
-        if mem.percent > threshold * 100:
-            print("Memory limit exceeded! Performing cleanup...")
-            gc.collect()  # Force garbage collection
-        time.sleep(1)  # Check memory every second
+def name_bigrams(name):
+    """Distinct character bigrams of a name, same windows as my_ngram."""
+    return {name[i:i + 2] for i in range(len(name) - 1)}
+
+def set_bigram_jaccard(name, to_find):
+    """Jaccard of the distinct bigram sets, the cheap first stage of the scoring cascade."""
+    bigrams1, bigrams2 = name_bigrams(name), name_bigrams(to_find)
+    union = len(bigrams1 | bigrams2)
+    return len(bigrams1 & bigrams2) / union if union else 0.0
+
 
 
 import threading
+import os
+import itertools
+import tempfile
+import heapq
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from output_sink import OutputSink
+from name_store import NameStore
+from name_normalizer import exact_join
+from phonetic_blocking import PhoneticIndex
+from minhash_lsh import MinHashIndex
+from metrics import Metrics, MetricsSampler
+from memory_governor import MemoryGovernor, default_budget
 
-# Create a lock for thread-safe file writing
-write_lock = threading.Lock()
+ROW_COLUMNS = ["CT_Siret", "CT_Num", "CT_Intitule", "DB_NAME"]
 
-def process_pair(name, to_find, good, bad):
-    n = my_ngram(name, to_find)
-    s = skibidi_learn(name, to_find)
-    f = the_fuzzz(name, to_find)
-    l = the_lengther(name, to_find)
-    moyenne = (n + s + f + l) / 4
-    result = {'name': name, 'to_find': to_find, 'moyenne': moyenne}
-    del n, s, f, l, moyenne
+# Read-only state shared with the workers, set once by init_worker() before any task runs.
+_good = None
+_bad = None
+_good_names = []
+_bad_names = []
+_scorer = None
+_blocking = None
+_phonetic = None
+_minhash = None
+_min_shared = 3
+_top_k = 0
+_floor = 0.0
+_bound_features = None
+_cascade = None
+# Seconds init_worker took in this process, added once to the counts of a shard
+_init_seconds = 0.0
+_init_lock = threading.Lock()
+# Per-scorer call counts and seconds of the shard the current thread is scoring, see process_shard
+_shard_counts = threading.local()
+
+def build_store(clients):
+    """
+    NameStore of the (CT_Siret, CT_Num, CT_Intitule, DB_NAME) records of a CSV, indexed by row id.
+
+    Records are addressed by their row id (position in the CSV), never by
+    name: a name that appears several times is several records, each scored
+    and written with its own row, and a name that appears once is one record.
+    """
+    return NameStore.build(clients, ROW_COLUMNS, 'CT_Intitule')
+
+def worker_options(args):
+    """The command line options a worker needs, as passed to init_worker."""
+    return {
+        'engine': args.engine,
+        'blocking': args.blocking,
+        'min_shared': args.min_shared,
+        'phonetic_distance': args.phonetic_distance,
+        'lsh': [args.lsh_bands, args.lsh_rows],
+        'lsh_cache': args.lsh_cache,
+        'top_k': args.top_k,
+        'floor': args.floor,
+        'cascade': list(args.cascade) if args.cascade else None,
+    }
+
+def init_worker(good, bad, options, scorer=None):
+    """
+    Sets the read-only worker state: stores, scorer, blocking, top-K and cascade settings.
+
+    Used as the process pool initializer with the paths of the saved stores
+    and BatchScorer, which each worker process attaches to instead of
+    unpickling its own copy of the rows, names and blocking index or fitting
+    its own scorer. Without a `scorer` path the batch engine is built here.
+    Options left out of `options` are off: no scorer, no blocking, no top-K,
+    no cascade.
+    """
+    global _good, _bad, _good_names, _bad_names, _scorer, _blocking, _phonetic, _minhash, _min_shared
+    global _top_k, _floor, _bound_features, _cascade, _init_seconds
+    start = time.perf_counter()
+    _good = NameStore.attach(good) if isinstance(good, str) else good
+    _bad = NameStore.attach(bad) if isinstance(bad, str) else bad
+    _good_names = _good.names
+    _bad_names = _bad.names
+    _scorer = None
+    if options.get('engine') == "batch":
+        _scorer = BatchScorer.attach(scorer, _good_names, _bad_names) if scorer else BatchScorer(_good_names, _bad_names)
+    _blocking = options.get('blocking')
+    _phonetic = PhoneticIndex(_good, options.get('phonetic_distance', 1)) if _blocking == "phonetic" else None
+    _minhash = MinHashIndex.cached(_good, options['lsh_cache'], *options['lsh']) if _blocking == "minhash" else None
+    _min_shared = options.get('min_shared', 3)
+    _top_k = options.get('top_k', 0)
+    _floor = options.get('floor', 0.0)
+    _bound_features = (bound_features(_good_names), bound_features(_bad_names)) if _top_k else None
+    _cascade = options.get('cascade')
+    _init_seconds = time.perf_counter() - start
+
+def block_candidates(bad_id):
+    """
+    Candidate good ids of one bad record: those found by the bigram index of
+    the store, those of its phonetic buckets, or every good record.
+    """
+    if _blocking == "bigram":
+        return _good.candidates(_bad_names[bad_id], _min_shared)
+    if _blocking == "phonetic":
+        return _phonetic.candidates(_bad_names[bad_id])
+    return list(range(len(_good_names)))
+
+def shard_candidates(bad_ids):
+    """Candidate good ids of every bad record of a shard, queried as one batch with the MinHash index."""
+    if _blocking == "minhash":
+        return _minhash.query([_bad_names[bad_id] for bad_id in bad_ids])
+    return map(block_candidates, bad_ids)
 
+_skibidi_analyzer = CountVectorizer(analyzer='char', ngram_range=(2, 2)).build_analyzer()
+
+def bound_features(names):
+    """
+    Per-name sizes the score upper bound is computed from: character count,
+    bigram count, number of distinct bigrams as skibidi_learn sees them and
+    number of distinct raw bigrams.
+    """
+    return (np.array([len(name) for name in names], dtype=np.float64),
+            np.array([max(len(name) - 1, 0) for name in names], dtype=np.float64),
+            np.array([len(set(_skibidi_analyzer(name))) for name in names], dtype=np.float64),
+            np.array([len(name_bigrams(name)) for name in names], dtype=np.float64))
+
+def _size_ratio(a, b, empty):
+    low, high = np.minimum(a, b), np.maximum(a, b)
+    out = np.full(low.shape, empty)
+    np.divide(low, high, out=out, where=high > 0)
+    return out
+
+def score_upper_bound(good_ids, bad_id):
+    """
+    Upper bound of the average score of each (good_id, bad_id) pair, from name sizes only.
+
+    Every scorer is bounded by how different the sizes are: a multiset
+    Jaccard (my_ngram, the_lengther) by min/max of the token counts,
+    skibidi_learn by min/(2*max - min) of its distinct bigram counts, and
+    fuzz.ratio by 2*min/(len_a + len_b). With the cascade on, a pair may keep
+    its set-bigram Jaccard instead, bounded by min/max of the distinct bigrams.
+    """
+    (good_chars, good_bigrams, good_distinct, good_sets), (bad_chars, bad_bigrams, bad_distinct, bad_sets) = _bound_features
+    good_ids = np.asarray(good_ids, dtype=np.int64)
+    chars_a, chars_b = good_chars[good_ids], bad_chars[bad_id]
+    ngram = _size_ratio(good_bigrams[good_ids], bad_bigrams[bad_id], 0.0)
+    low = np.minimum(good_distinct[good_ids], bad_distinct[bad_id])
+    high = np.maximum(good_distinct[good_ids], bad_distinct[bad_id])
+    skibidi = np.zeros(low.shape)
+    np.divide(low, 2 * high - low, out=skibidi, where=high > 0)
+    fuzzz = np.zeros(chars_a.shape)
+    np.divide(2 * np.minimum(chars_a, chars_b), chars_a + chars_b, out=fuzzz, where=(chars_a + chars_b) > 0)
+    fuzzz = np.round(fuzzz * 100) / 100
+    lengther = _size_ratio(chars_a, np.full(chars_a.shape, chars_b), 1.0)
+    bound = (ngram + skibidi + fuzzz + lengther) / 4
+    if _cascade is not None:
+        bound = np.maximum(bound, _size_ratio(good_sets[good_ids], bad_sets[bad_id], 0.0))
+    return bound
+
+def categorize(moyenne):
     category = None
-    if 0 <= moyenne < 33.7:
+    if 0 <= moyenne < 0.337:
         category = 'no_chance'
-    elif 33.7 <= moyenne < 65:
+    elif 0.337 <= moyenne < 0.65:
         category = 'probable'
-    elif 65 <= moyenne < 100:
+    elif 0.65 <= moyenne <= 1:
         category = 'valid'
+    return category
 
-    # Prepare the output row based on category
-    output_row = [
-        good["CT_Siret"][good['CT_Intitule'] == name].values[1],
-        good["CT_Num"][good['CT_Intitule'] == name].values[1],
-        good["CT_Intitule"][good['CT_Intitule'] == name].values[1],
-        good["DB_NAME"][good['CT_Intitule'] == name].values[1],
-        bad["CT_Siret"][bad['CT_Intitule'] == to_find].values[1],
-        bad["CT_Num"][bad['CT_Intitule'] == to_find].values[1],
-        bad["CT_Intitule"][bad['CT_Intitule'] == to_find].values[1],
-        bad["DB_NAME"][bad['CT_Intitule'] == to_find].values[1]
-    ]
+def match_row(category, good_id, bad_id, result):
+    if category == 'top_k':
+        return _good.row(good_id) + _bad.row(bad_id) + (result['rank'], result['moyenne'])
+    return _good.row(good_id) + _bad.row(bad_id)
+
+def timed(name, calls, fn, *args):
+    """
+    Calls fn(*args), adding `calls` to the `calls:<name>` count and its time
+    to `seconds:<name>` of the shard being scored by this thread, if any.
+    """
+    counts = getattr(_shard_counts, 'counts', None)
+    if counts is None:
+        return fn(*args)
+    start = time.perf_counter()
+    result = fn(*args)
+    counts[f'seconds:{name}'] += time.perf_counter() - start
+    counts[f'calls:{name}'] += calls
+    return result
+
+def score_pair(good_id, bad_id):
+    name = _good_names[good_id]
+    to_find = _bad_names[bad_id]
+    n = timed('my_ngram', 1, my_ngram, name, to_find)
+    s = timed('skibidi_learn', 1, skibidi_learn, name, to_find)
+    f = timed('the_fuzzz', 1, the_fuzzz, name, to_find)
+    l = timed('the_lengther', 1, the_lengther, name, to_find)
+    moyenne = (n + s + f + l) / 4
+    del n, s, f, l
+    return moyenne
+
+def full_scores(good_ids, bad_id):
+    """
+    Average of the four scorers for each candidate.
 
-    # Write to the appropriate file based on category
-    with write_lock:  # Acquire the lock before writing
-        with open(f'{category}.csv', mode='a', newline='') as df:
-            writer = csv.writer(df)
-            writer.writerow(output_row)
-    del output_row
-    return category, result
+    With a BatchScorer the whole block goes through sparse matrix products,
+    without one every pair goes through score_pair, the reference path.
+    """
+    if _scorer is None:
+        return [score_pair(good_id, bad_id) for good_id in good_ids]
+    counts = getattr(_shard_counts, 'counts', None)
+    return _scorer.score_pairs(good_ids, [bad_id] * len(good_ids), counts)['moyenne'].tolist()
 
-def main():
+def cheap_scores(good_ids, bad_id):
+    if _scorer is None:
+        return [timed('set_bigram_jaccard', 1, set_bigram_jaccard, _good_names[good_id], _bad_names[bad_id])
+                for good_id in good_ids]
+    return timed('batch_cheap', len(good_ids), _scorer.set_jaccard_pairs, good_ids, [bad_id] * len(good_ids)).tolist()
+
+def cascade_scores(good_ids, bad_id, band):
+    """
+    Scores with the cascade: every pair gets the cheap set-bigram Jaccard, and
+    only pairs whose cheap score falls inside `band` (low, high) go on to the
+    full average, which then replaces it. Returns the scores and a Counter of
+    pairs per stage.
+    """
+    low, high = band
+    scores = cheap_scores(good_ids, bad_id)
+    ambiguous = [i for i, score in enumerate(scores) if low <= score <= high]
+    if ambiguous:
+        full = full_scores([good_ids[i] for i in ambiguous], bad_id)
+        for i, score in zip(ambiguous, full):
+            scores[i] = score
+    return scores, Counter(cheap=len(scores), full=len(ambiguous))
+
+def score_block(good_ids, bad_id):
+    """
+    Scores one bad record against its candidate good records.
+
+    Returns its (category, good_id, bad_id, result) matches and a Counter of
+    the pairs that reached each scoring stage.
+    """
+    if _cascade is None:
+        scores = full_scores(good_ids, bad_id)
+        stages = Counter(full=len(scores))
+    else:
+        scores, stages = cascade_scores(good_ids, bad_id, _cascade)
+    to_find = _bad_names[bad_id]
+    matches = [(categorize(moyenne), good_id, bad_id, {'name': _good_names[good_id], 'to_find': to_find, 'moyenne': moyenne})
+               for good_id, moyenne in zip(good_ids, scores)]
+    return matches, stages
+
+def top_k_block(good_ids, bad_id, chunk_size=64):
+    """
+    Keeps the `_top_k` best good candidates of one bad record scoring at least `_floor`.
+
+    Candidates are visited by decreasing score upper bound and scored a chunk
+    at a time; as soon as the bound of the next candidate cannot beat both the
+    floor and the current K-th best score, it and every remaining candidate
+    are pruned without being scored. Returns ranked ('top_k', good_id, bad_id,
+    result) matches, the number of pairs actually scored and their stage counts.
+    """
+    bounds = score_upper_bound(good_ids, bad_id)
+    order = np.argsort(-bounds, kind='stable')
+    good_ids = np.asarray(good_ids, dtype=np.int64)[order]
+    bounds = bounds[order]
+    best = []
+    position = 0
+    scored = 0
+    stages = Counter()
+    while position < len(good_ids):
+        threshold = max(_floor, best[0][0]) if len(best) == _top_k else _floor
+        if bounds[position] < threshold:
+            break
+        chunk = good_ids[position:position + chunk_size]
+        chunk = chunk[bounds[position:position + chunk_size] >= threshold]
+        position += chunk_size
+        scored += len(chunk)
+        chunk_matches, chunk_stages = score_block(chunk.tolist(), bad_id)
+        stages.update(chunk_stages)
+        for _, good_id, _, result in chunk_matches:
+            if result['moyenne'] < _floor:
+                continue
+            entry = (result['moyenne'], -good_id, result)
+            if len(best) < _top_k:
+                heapq.heappush(best, entry)
+            elif entry[:2] > best[0][:2]:
+                heapq.heapreplace(best, entry)
+    ranked = sorted(best, key=lambda entry: entry[:2], reverse=True)
+    matches = []
+    for rank, (_, good_id, result) in enumerate(ranked, start=1):
+        result['rank'] = rank
+        matches.append(('top_k', -good_id, bad_id, result))
+    return matches, scored, stages
+
+def match_block(good_ids, bad_id):
+    """
+    Scores one candidate block in the configured mode, returning its matches
+    and a Counter of pairs scored, pruned and per scoring stage.
+    """
+    if _top_k:
+        matches, scored, counts = top_k_block(good_ids, bad_id)
+    else:
+        matches, counts = score_block(good_ids, bad_id)
+        scored = len(good_ids)
+    counts.update(scored=scored, pruned=len(good_ids) - scored)
+    return matches, counts
+
+def bounded_map(executor, fn, tasks, max_in_flight, report=None):
+    """
+    Runs fn(*task) for every task of a lazy iterable with at most `max_in_flight`
+    tasks submitted at once, yielding each result as soon as it is done.
+
+    Tasks are only pulled from the iterable when a slot frees up, so memory
+    depends on `max_in_flight`, not on the number of tasks. Results come back
+    in completion order. `max_in_flight` may be a callable returning the
+    current limit, read before every refill, as the MemoryGovernor does.
+    `report`, if given, is called with the number of tasks in flight
+    whenever it changes.
+    """
+    tasks = iter(tasks)
+    limit = max_in_flight if callable(max_in_flight) else lambda: max_in_flight
+    pending = set()
+    while True:
+        for task in itertools.islice(tasks, max(limit() - len(pending), 0)):
+            pending.add(executor.submit(fn, *task))
+        if not pending:
+            return
+        if report is not None:
+            report(len(pending))
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield future.result()
+
+def process_shard(shard_id, bad_ids):
+    """
+    Scores a shard of bad records against their candidates inside a worker.
+
+    Nothing is written here: the shard comes back to the parent as its id, its
+    list of (category, good_id, bad_id, result) matches and its per-category,
+    scored/pruned and per-scorer counts, with the time it took as the
+    `seconds:worker:score` entry, and the first shard of a worker process
+    the time its init_worker took as `seconds:worker:index`. `resolved`
+    counts the bad records with a match in the valid range.
+    """
+    start = time.perf_counter()
+    matches = []
+    counts = Counter()
+    init_seconds = take_init_seconds()
+    if init_seconds:
+        counts['seconds:worker:index'] += init_seconds
+    _shard_counts.counts = counts
+    try:
+        for bad_id, good_ids in zip(bad_ids, shard_candidates(bad_ids)):
+            if not good_ids:
+                continue
+            block, block_counts = match_block(good_ids, bad_id)
+            matches.extend(block)
+            counts.update(block_counts)
+            counts['resolved'] += any(result['moyenne'] >= 0.65 for _, _, _, result in block)
+            counts.update(match[0] for match in block)
+    finally:
+        _shard_counts.counts = None
+    counts['seconds:worker:score'] += time.perf_counter() - start
+    return shard_id, matches, counts
+
+def take_init_seconds():
+    """The time init_worker took in this process, returned once."""
+    global _init_seconds
+    with _init_lock:
+        seconds, _init_seconds = _init_seconds, 0.0
+    return seconds
+
+def shard_tasks(bad_ids, shard_size, completed=()):
+    """Lazily yields (shard_id, bad_ids) work units of the given bad ids, skipping the shards already completed."""
+    for shard_id, start in enumerate(range(0, len(bad_ids), shard_size)):
+        if shard_id not in completed:
+            yield shard_id, bad_ids[start:start + shard_size].tolist()
+
+def exact_rows(pairs, top_k):
+    """
+    Output (category, row) pairs of the exact canonical-key matches, all in the
+    'exact' category. In top-K mode a bad record keeps its first K matches,
+    ranked by good id, with a score of 1.0.
+    """
+    if top_k:
+        ranks = pairs.groupby('bad_id').cumcount() + 1
+        for good_id, bad_id, rank in zip(pairs['good_id'], pairs['bad_id'], ranks):
+            if rank <= top_k:
+                yield 'exact', _good.row(good_id) + _bad.row(bad_id) + (rank, 1.0)
+    else:
+        for good_id, bad_id in zip(pairs['good_id'], pairs['bad_id']):
+            yield 'exact', _good.row(good_id) + _bad.row(bad_id)
+
+def load_checkpoint(path):
+    with open(path) as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    checkpoint['completed'] = set(checkpoint['completed'])
+    return checkpoint
+
+def save_checkpoint(path, checkpoint):
+    """Writes the checkpoint through a temporary file, so a crash never leaves a truncated one behind."""
+    state = dict(checkpoint, completed=sorted(checkpoint['completed']))
+    with open(path + '.tmp', 'w') as checkpoint_file:
+        json.dump(state, checkpoint_file, indent=4)
+    os.replace(path + '.tmp', path)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Match bad-SIRET clients against good-SIRET clients by name.")
+    parser.add_argument("--blocking", choices=["bigram", "phonetic", "minhash", "cartesian"], default="bigram",
+                        help="candidate generation: shared-bigram index, French phonetic key buckets, "
+                             "MinHash LSH buckets, or every good x bad pair")
+    parser.add_argument("--min-shared", type=int, default=3,
+                        help="distinct bigrams a pair must share to be scored (bigram blocking)")
+    parser.add_argument("--phonetic-distance", type=int, choices=[0, 1], default=1,
+                        help="phonetic blocking: 0 scores the names of the same key only, 1 also those one "
+                             "code apart")
+    parser.add_argument("--lsh-bands", type=int, default=32,
+                        help="MinHash blocking: bands of the signatures, more bands find more pairs")
+    parser.add_argument("--lsh-rows", type=int, default=3,
+                        help="MinHash blocking: signature values per band, more rows score fewer pairs")
+    parser.add_argument("--lsh-cache", default="enterprise_finder.minhash",
+                        help="MinHash blocking: directory the signatures and buckets are kept in across runs")
+    parser.add_argument("--engine", choices=["batch", "pair"], default="batch",
+                        help="score candidate blocks with sparse matrices, or pair by pair with the reference scorers")
+    parser.add_argument("--executor", choices=["thread", "process"], default="thread",
+                        help="run scoring in a thread pool, or in a process pool over shards of bad records")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="number of worker threads or processes")
+    parser.add_argument("--store", default=None,
+                        help="directory the good and bad name stores and the batch engine are saved to for the process workers "
+                             "(default: a temporary directory)")
+    parser.add_argument("--shard-size", type=int, default=256,
+                        help="bad records per work unit, also the checkpoint granularity")
+    parser.add_argument("--top-k", type=int, default=0,
+                        help="keep only the K best good candidates of each bad record in top_k.csv (0: category dumps)")
+    parser.add_argument("--floor", type=float, default=0.0,
+                        help="minimum average score of a top-K candidate")
+    parser.add_argument("--cascade", type=float, nargs=2, metavar=("LOW", "HIGH"), default=None,
+                        help="score with the cheap set-bigram Jaccard first and run the full average only "
+                             "when it falls between LOW and HIGH")
+    parser.add_argument("--flush-interval", type=float, default=1.0,
+                        help="seconds between batched writes of the output files")
+    parser.add_argument("--checkpoint", default="enterprise_finder.checkpoint.json",
+                        help="file recording completed shards and output offsets")
+    parser.add_argument("--checkpoint-interval", type=float, default=60.0,
+                        help="seconds between checkpoints")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip the shards completed in the checkpoint and append to the existing outputs")
+    parser.add_argument("--no-exact-join", action="store_true",
+                        help="send every bad record to fuzzy scoring, without first joining the names on their "
+                             "canonical key (case, accents, punctuation and legal forms removed) into exact.csv")
+    parser.add_argument("--checksum-fail", action="store_true",
+                        help="also look for the clients of client_checksum_siret.csv, whose SIRET fails its Luhn key")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="tasks submitted at once, defaults to 4 per worker")
+    parser.add_argument("--memory-budget", type=float, default=None,
+                        help="RSS budget in MB of the run and its workers, 70%% of the machine's memory by default")
+    parser.add_argument("--log-every", type=int, default=1000,
+                        help="print one match out of this many (0: none)")
+    parser.add_argument("--metrics", default=None,
+                        help="file the run metrics are sampled to, off by default")
+    parser.add_argument("--metrics-format", choices=["jsonl", "prometheus"], default="jsonl",
+                        help="one JSON line per sample, or a Prometheus textfile holding the last sample")
+    parser.add_argument("--metrics-interval", type=float, default=5.0,
+                        help="seconds between metrics samples")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
     all_time_start = time.time()
-    good = pd.read_csv('client_good_siret.csv')
-    bad = pd.read_csv('client_bad_siret.csv')
+    metrics = Metrics()
+    with metrics.stage('load'):
+        good = pd.read_csv('client_good_siret.csv')
+        bad = pd.read_csv('client_bad_siret.csv')
+        if args.checksum_fail:
+            bad = pd.concat([bad, pd.read_csv('client_checksum_siret.csv')], ignore_index=True)
+        good_store = build_store(good)
+        bad_store = build_store(bad)
     colors = ["blue", "red", "white", "green", "yellow"]
     header = [
         "CT_Siret_Good", "CT_Num_Good", "CT_Intitule_Good", "DB_NAME_Good",
         "CT_Siret_Found", "CT_Num_Found", "CT_Intitule_Found", "DB_NAME_Found"
     ]
 
-    for category in ['valid', 'probable', 'no_chance']:
-        with open(f'{category}.csv', mode='w', newline='') as df:
-            writer = csv.writer(df)
-            writer.writerow(header)
-
-    monitor_thread = threading.Thread(target=monitor_memory)
-    monitor_thread.daemon = True  # Allows thread to exit when main program does
-    monitor_thread.start()
-    with ThreadPoolExecutor() as executor:
-        future_to_pair = {
-            executor.submit(process_pair, name, to_find, good, bad): (name, to_find,  good, bad)
-            for name in tqdm(good['CT_Intitule'], desc="Processing good", total=len(good), colour='magenta')
-            for to_find in tqdm(bad['CT_Intitule'], desc="try_match", total=len(bad), colour=random.choice(colors))
-        }
-
-        for future in tqdm(as_completed(future_to_pair), total=len(future_to_pair), desc="Finalizing Results"):
-            category, result = future.result()
-            name, to_find = future_to_pair[future]
-            print(f"result[{result}]: {category} for {name} and {to_find}")
-            del category, result
+    options = worker_options(args)
+    checkpoint = {'options': options, 'shard_size': args.shard_size, 'records': [len(good_store), len(bad_store)],
+                  'fingerprints': [good_store.fingerprint(), bad_store.fingerprint()],
+                  'exact_join': not args.no_exact_join, 'completed': set(), 'offsets': None, 'totals': {}}
+    if args.resume:
+        if not os.path.exists(args.checkpoint):
+            print(f"ERROR: No checkpoint to resume from at {args.checkpoint}.")
+            exit(84)
+        previous = load_checkpoint(args.checkpoint)
+        if {key: previous.get(key) for key in ('options', 'shard_size', 'records', 'exact_join')} != \
+                {key: checkpoint[key] for key in ('options', 'shard_size', 'records', 'exact_join')}:
+            print("ERROR: The checkpoint was made with other options or inputs, resume with the same ones.")
+            exit(84)
+        if previous.get('fingerprints') != checkpoint['fingerprints']:
+            # Same sizes, other rows: shard ids would now point at other records
+            print("ERROR: The client CSV files changed since the checkpoint was made, run again without --resume.")
+            exit(84)
+        checkpoint = previous
+        print(f"Resuming: {len(checkpoint['completed'])} shards already completed.")
+
+    with metrics.stage('exact_join'):
+        pairs = exact_join(good['CT_Intitule'], bad['CT_Intitule']) if not args.no_exact_join else None
+        leftovers = np.arange(len(bad_store))
+        if pairs is not None:
+            leftovers = np.setdiff1d(leftovers, pairs['bad_id'].unique())
+    exact = ['exact'] if pairs is not None else []
+    if args.top_k:
+        sink = OutputSink(['top_k'] + exact, header + ["Rank", "Score"], flush_interval=args.flush_interval,
+                          metrics=metrics)
+    else:
+        sink = OutputSink(['valid', 'probable', 'no_chance'] + exact, header, flush_interval=args.flush_interval,
+                          metrics=metrics)
+    sink.start(checkpoint['offsets'])
+    if not args.resume:
+        # Replaces the checkpoint of a previous run right away: resuming from it
+        # after a crash of this run would skip its shards and regrow the files.
+        sink.flush()
+        checkpoint['offsets'] = sink.offsets()
+        save_checkpoint(args.checkpoint, checkpoint)
+    metrics.gauge('sink_queue', sink.backlog)
+    metrics.gauge('shards_done', lambda: len(checkpoint['completed']))
+    sampler = None
+    if args.metrics:
+        sampler = MetricsSampler(metrics, args.metrics, args.metrics_format, args.metrics_interval)
+        sampler.start()
+
+    totals = Counter(checkpoint['totals'])
+    max_in_flight = args.max_in_flight or 4 * args.workers
+    budget = int(args.memory_budget * 2 ** 20) if args.memory_budget else default_budget()
+    governor = MemoryGovernor(budget, max_in_flight, sink=sink, metrics=metrics)
+    store_dir = None
+    if args.executor == "process":
+        # The parent only writes the rows, scoring and blocking live in the workers.
+        init_worker(good_store, bad_store, {})
+        if args.blocking == "minhash":
+            # Built or refreshed once here, the workers only map it.
+            MinHashIndex.cached(good_store, args.lsh_cache, args.lsh_bands, args.lsh_rows)
+        if args.store is None:
+            store_dir = tempfile.TemporaryDirectory(prefix="enterprise_finder.")
+        path = args.store or store_dir.name
+        good_store.save(os.path.join(path, "good"))
+        bad_store.save(os.path.join(path, "bad"))
+        scorer_path = None
+        if args.engine == "batch":
+            # Vectorized once here, the workers only map the matrices.
+            scorer_path = os.path.join(path, "scorer")
+            with metrics.stage('index'):
+                BatchScorer(good_store.names, bad_store.names).save(scorer_path)
+        executor = ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                                       initargs=(os.path.join(path, "good"), os.path.join(path, "bad"), options,
+                                                 scorer_path))
+    else:
+        init_worker(good_store, bad_store, options)
+        # Built once, in this process: wall time, not worker time
+        metrics.add_time('index', take_init_seconds())
+        executor = ThreadPoolExecutor(max_workers=args.workers)
+    if pairs is not None and not checkpoint['totals'].get('exact_rows'):
+        # Written and checkpointed once, before any shard, so a resumed run never writes them twice.
+        sink.put_many(exact_rows(pairs, args.top_k))
+        totals.update(exact=len(pairs), exact_rows=len(bad_store) - len(leftovers))
+        sink.flush()
+        checkpoint.update(offsets=sink.offsets(), totals=dict(totals))
+        save_checkpoint(args.checkpoint, checkpoint)
+    shards = shard_tasks(leftovers, args.shard_size, checkpoint['completed'])
+    shard_count = -(-len(leftovers) // args.shard_size)
+    results = tqdm(bounded_map(executor, process_shard, shards, governor,
+                               report=lambda in_flight: metrics.gauge('in_flight', in_flight)),
+                   initial=len(checkpoint['completed']), total=shard_count,
+                   desc="try_match", colour=random.choice(colors))
+    last_checkpoint = time.monotonic()
+    logged = 0
+    # The score stage is the wall time of the drain loop, the workers' own time goes to the worker seconds
+    with executor, metrics.stage('score'):
+        for shard_id, matches, counts in results:
+            metrics.add(counts)
+            totals.update({key: value for key, value in counts.items() if ':' not in key})
+            sink.put_many((match[0], match_row(*match)) for match in matches)
+            if args.log_every:
+                # Only every log_every-th match is printed, printing them all costs more than scoring some
+                for category, _, _, result in matches[(-logged) % args.log_every::args.log_every]:
+                    tqdm.write(f"result[{result}]: {category} for {result['name']} and {result['to_find']}")
+                logged += len(matches)
+            checkpoint['completed'].add(shard_id)
+            del matches, counts
+            governor.check()
+            if time.monotonic() - last_checkpoint >= args.checkpoint_interval:
+                # Every row of the completed shards must be on disk before their offsets are recorded.
+                sink.flush()
+                checkpoint.update(offsets=sink.offsets(), totals=dict(totals))
+                save_checkpoint(args.checkpoint, checkpoint)
+                last_checkpoint = time.monotonic()
+    sink.flush()
+    checkpoint.update(offsets=sink.offsets(), totals=dict(totals))
+    save_checkpoint(args.checkpoint, checkpoint)
+    sink.close()
+    if store_dir is not None:
+        store_dir.cleanup()
+    if sampler is not None:
+        sampler.stop()
 
+    total_pairs = len(good_store) * len(bad_store)
+    candidate_pairs = totals['scored'] + totals['pruned']
+    print(f"pairs scored: {totals['scored']}/{total_pairs} "
+          f"(reduction ratio: {1 - candidate_pairs / total_pairs if total_pairs else 0:.2%}, "
+          f"pruned by score bound: {totals['pruned']})")
+    if pairs is not None:
+        print(f"exact-key join: {totals['exact_rows']} bad rows resolved ({totals['exact']} pairs in exact.csv)")
+    print(f"fuzzy scoring: {len(leftovers)} bad rows, {totals['resolved']} with a valid match")
+    if args.cascade:
+        print(f"cascade stages: cheap {totals['cheap']}, full {totals['full']}")
+    snapshot = metrics.snapshot()
+    print("stages: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in snapshot['stages'].items()))
+    print("worker-seconds: " + ", ".join(f"{name} {seconds:.2f}s"
+                                         for name, seconds in snapshot['worker_seconds'].items()))
+    print("scorers: " + ", ".join(f"{name} {scorer['calls']} calls {scorer['seconds']:.2f}s"
+                                  for name, scorer in snapshot['scorers'].items()))
+    print(f"pairs/sec: {snapshot['scored_per_sec']:.0f}")
     all_time_end = time.time()
     print("timer :", all_time_end - all_time_start)
     del all_time_end, all_time_start, good, bad, colors, header
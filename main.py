@@ -1,11 +1,144 @@
 from tqdm import tqdm
 import os
+import time
+import argparse
+import threading
 import pandas as pd
 from dotenv import load_dotenv
-import pyodbc
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import json
+from collections import Counter
+from snapshot_store import SnapshotStore
+from siret_classifier import SiretClassifier, checksum_valid
 
-def get_filtered_siret(db_name):
+def open_connection(db_name=None):
+    """
+    @brief Opens a pyodbc connection to the DB_ADDR server.
+
+    @param db_name The database to connect to, or None to stay on the login's default database.
+
+    @return The pyodbc connection.
+    """
+    # Imported here so the module loads without an ODBC driver, with a fake connect
+    import pyodbc
+    load_dotenv()
+    server = os.getenv('DB_ADDR')
+    username = os.getenv('DB_USER')
+    password = os.getenv('DB_PASS')
+    database = ';DATABASE=' + db_name if db_name else ''
+    return pyodbc.connect('DRIVER={SQL Server};SERVER='+server+database+';UID='+username+';PWD='+ password)
+
+class ConnectionPool:
+    """
+    @brief Hands out one connection per worker thread, reused for every database it extracts.
+
+    All the Sage databases live on the DB_ADDR server, so a worker switches
+    database on its connection instead of opening a new one.
+    """
+
+    def __init__(self, connect=open_connection):
+        """
+        @param connect Factory returning a new DB-API connection, replaceable by a
+                       fake-connection or SQLite stand-in for tests.
+        """
+        self._connect = connect
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def get(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._connect()
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def discard(self):
+        """
+        @brief Closes the calling worker's connection after a failed query.
+
+        A dropped link or a transaction left open would otherwise fail every
+        later database of the worker. The next get() opens a new connection.
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            return
+        self._local.connection = None
+        with self._lock:
+            self._connections.remove(connection)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close(self):
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+
+def split_categories(classified):
+    """
+    @brief Splits the single-scan result into the frames of the three-query path.
+
+    @param classified The rows of the single-scan query, with their Category column.
+
+    @return A tuple (good, dup, bad) with the columns the three-query path returns:
+            CleanSIRET for good and duplicate rows, OriginalSIRET for bad ones.
+            Rows without a category (NULL CT_Siret) are dropped, as the three
+            queries never return them either.
+    """
+    columns = ['CT_Num', 'CT_Intitule', 'DB_Name']
+    frames = []
+    for category, siret in (('good', 'CleanSIRET'), ('dup', 'CleanSIRET'), ('bad', 'OriginalSIRET')):
+        rows = classified[classified['Category'] == category]
+        frames.append(rows[[siret] + columns].reset_index(drop=True))
+    return tuple(frames)
+
+def split_checksum(good, dup):
+    """
+    @brief Moves the good and duplicate rows whose SIREN / SIRET fails its Luhn key to a checksum_fail frame.
+
+    The key only depends on the number, so every row of a SIRET moves
+    together and the duplicate marking of the others is unchanged.
+
+    @return A tuple (good, dup, checksum_fail) of DataFrames, the SIRET in their first column.
+    """
+    good_ok = checksum_valid(good.iloc[:, 0])
+    dup_ok = checksum_valid(dup.iloc[:, 0])
+    checksum_fail = pd.concat([good[~good_ok], dup[~dup_ok]], ignore_index=True)
+    return good[good_ok].reset_index(drop=True), dup[dup_ok].reset_index(drop=True), checksum_fail
+
+def classify_rows(rows, classifier):
+    """
+    @brief Classifies plain F_COMPTET rows in-process, with the columns of the single-scan query.
+
+    @param rows A DataFrame with the CT_Siret, CT_Num, CT_Intitule and DB_Name columns.
+    @param classifier The SiretClassifier of the database, carrying the SIRET seen in earlier chunks.
+
+    @return The rows with Category, CleanSIRET and OriginalSIRET columns, ready for split_categories.
+    """
+    labels, clean = classifier.classify(rows['CT_Siret'])
+    # The queries file empty SIRET as bad and leave NULL ones without category
+    category = labels.replace('empty', 'bad').where(rows['CT_Siret'].notna(), None)
+    return pd.DataFrame({
+        'Category': category,
+        'CleanSIRET': clean,
+        'OriginalSIRET': rows['CT_Siret'],
+        'CT_Num': rows['CT_Num'],
+        'CT_Intitule': rows['CT_Intitule'],
+        'DB_Name': rows['DB_Name'],
+    })
+
+def read_chunks(query, connection, chunksize=None):
+    """Runs a query with pandas, as an iterator of DataFrames of at most `chunksize` rows, or of one DataFrame."""
+    if chunksize is None:
+        return iter([pd.read_sql(query, connection)])
+    return pd.read_sql(query, connection, chunksize=chunksize)
+
+def get_filtered_siret(db_name, connection=None, query_mode="single"):
     """
     @brief Connects to the specified database and retrieves filtered SIRET data.
 
@@ -14,6 +147,13 @@ def get_filtered_siret(db_name):
     from the specified database.
 
     @param db_name The name of the database to connect to.
+    @param connection An open connection to reuse, switched to db_name with USE.
+                      Without one a connection is opened for this call and closed after it.
+    @param query_mode "single" scans F_COMPTET once and classifies every row with a
+                      Category column, split client-side. "split" runs the original
+                      three queries, kept as a fallback to validate the single scan.
+                      "local" runs a plain SELECT and classifies the rows in-process
+                      with siret_classifier, leaving the server a bare table scan.
 
     @return A tuple of three pandas DataFrames: 
             - The first DataFrame contains valid SIRET data.
@@ -28,16 +168,37 @@ def get_filtered_siret(db_name):
     - Valid SIRET: Length of 14 or 9, numeric format.
     - Invalid SIRET: Any SIRET that doesn't meet the valid criteria.
     - Duplicate SIRET: Valid SIRETs that appear more than once.
+
+    The three-query path runs the CTE, and its window sort, once per category,
+    and the duplicate numbering ORDER BY (SELECT NULL) is not guaranteed to be
+    the same between them. The single scan runs it once for all three.
     """
-    load_dotenv()
-    server = os.getenv('DB_ADDR')
-    database = db_name
-    username = os.getenv('DB_USER')
-    password = os.getenv('DB_PASS')
+    try:
+        (frames,) = iter_filtered_siret(db_name, connection, query_mode)
+        return frames
+    except Exception as e:
+        print(f"Couldn't connect to the db: {str(e)}")
+        return None
+
+def iter_filtered_siret(db_name, connection=None, query_mode="single", chunksize=None):
+    """
+    @brief Streams the (good, dup, bad) DataFrames of a database, chunk by chunk.
 
+    Same queries and parameters as get_filtered_siret. With a chunksize the
+    rows are fetched from the cursor `chunksize` at a time, and one tuple is
+    yielded per chunk, so only one chunk is held in memory. In split mode
+    each chunk only fills the frame of the query it comes from. Without a
+    chunksize a single tuple holds everything.
+
+    @note Errors are raised, not printed.
+    """
+    engine = None
     try:
-        # Create pyodbc engine
-        engine = pyodbc.connect('DRIVER={SQL Server};SERVER='+server+';DATABASE='+database+';UID='+username+';PWD='+ password)
+        if connection is None:
+            # Create pyodbc engine
+            engine = connection = open_connection(db_name)
+        else:
+            connection.cursor().execute(f"USE [{db_name}];")
 
         # Use pyodbc engine with pandas
         querybase = "SELECT [CT_Siret], [CT_Num], [CT_Intitule], DB_NAME() as 'DB_Name' FROM [F_COMPTET] WHERE CT_Type=0 AND CT_Sommeil=0;"
@@ -89,13 +250,145 @@ def get_filtered_siret(db_name):
                                 OR CleanSIRET LIKE '[0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9]')
                             AND RowNum > 1;
                     """
-        good = pd.read_sql(query1 + querygood, engine)
-        dup = pd.read_sql(query1 + querydup, engine)
-        bad = pd.read_sql(query1 + querybad, engine)
-        return good, dup, bad
+        querysingle = """SELECT CASE
+                                WHEN (LEN(CleanSIRET) = 14 OR LEN(CleanSIRET) = 9)
+                                    AND (CleanSIRET LIKE '[0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9]' 
+                                        OR CleanSIRET LIKE '[0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9]')
+                                    THEN CASE WHEN RowNum = 1 THEN 'good' ELSE 'dup' END
+                                WHEN NOT ((LEN(CleanSIRET) = 14 OR LEN(CleanSIRET) = 9)
+                                    AND (CleanSIRET LIKE '[0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9]' 
+                                        OR CleanSIRET LIKE '[0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9]'))
+                                    THEN 'bad'
+                            END AS Category,
+                            CleanSIRET,
+                            OriginalSIRET,
+                            [CT_Num],
+                            [CT_Intitule],
+                            DB_NAME() as 'DB_Name'
+                        FROM CleanedSIRET;
+                    """
+        querylocal = "SELECT [CT_Siret], [CT_Num], [CT_Intitule], DB_NAME() as 'DB_Name' FROM [F_COMPTET];"
+        if query_mode == "local":
+            classifier = SiretClassifier()
+            for chunk in read_chunks(querylocal, connection, chunksize):
+                yield split_categories(classify_rows(chunk, classifier))
+        elif query_mode == "single":
+            for chunk in read_chunks(query1 + querysingle, connection, chunksize):
+                yield split_categories(chunk)
+        elif chunksize is None:
+            good = pd.read_sql(query1 + querygood, connection)
+            dup = pd.read_sql(query1 + querydup, connection)
+            bad = pd.read_sql(query1 + querybad, connection)
+            yield good, dup, bad
+        else:
+            for position, query in enumerate((querygood, querydup, querybad)):
+                for chunk in read_chunks(query1 + query, connection, chunksize):
+                    frames = [chunk.iloc[0:0]] * 3
+                    frames[position] = chunk
+                    yield tuple(frames)
+    finally:
+        if engine is not None:
+            engine.close()
+
+def write_categories(good, dup, bad, checksum=True):
+    """
+    @brief Appends one batch of classified rows to the CSV files, the Luhn failures to client_checksum_siret.csv.
+
+    @param checksum False to keep the format-only classification, without a checksum_fail category.
+
+    @return The number of rows written per category.
+    """
+    checksum_fail = good.iloc[0:0]
+    if checksum:
+        good, dup, checksum_fail = split_checksum(good, dup)
+        write_csv(checksum_fail, "checksum")
+    write_csv(good, "good")
+    write_csv(dup, "dup")
+    write_csv(bad, "bad")
+    return {"good": len(good), "duplicate": len(dup), "bad": len(bad), "checksum_fail": len(checksum_fail)}
+
+def extract_database(db_name, pool, query_mode="single", chunksize=None, checksum=True):
+    """
+    @brief Extracts one database on the calling worker's pooled connection and appends it to the CSV files.
+
+    Each chunk is written as soon as it arrives and only its counts are kept,
+    so memory stays at one chunk however large F_COMPTET is.
+
+    @return A tuple (db_name, counts, seconds) where counts holds the number of
+            good, duplicate, bad and checksum_fail rows, or is None if the
+            extraction failed, and seconds is the wall time of the extraction.
+    """
+    start = time.perf_counter()
+    counts = Counter()
+    try:
+        for good, dup, bad in iter_filtered_siret(db_name, pool.get(), query_mode, chunksize):
+            counts.update(write_categories(good, dup, bad, checksum))
     except Exception as e:
         print(f"Couldn't connect to the db: {str(e)}")
-        return None
+        pool.discard()
+        counts = None
+    return db_name, counts, time.perf_counter() - start
+
+# Content hash of the columns the classification reads, hex encoded by the server
+ROW_HASH = "CONVERT(VARCHAR(40), HASHBYTES('SHA1', CONCAT(ISNULL(CT_Siret, CHAR(30)), CHAR(31), CT_Intitule)), 2) AS RowHash"
+# Under the 2100 parameters SQL Server accepts per statement
+DELTA_BATCH = 1000
+
+def extract_delta(db_name, pool, store, chunksize=None, row_hash=ROW_HASH):
+    """
+    @brief Brings the snapshot of one database up to date, fetching only new and changed rows.
+
+    A first run fetches the whole F_COMPTET. Later runs scan only CT_Num and
+    the content hash of every row, compare them with the snapshot, and fetch
+    the full rows of the keys whose hash is new or different, DELTA_BATCH
+    keys per query. Keys missing from the scan are deleted from the snapshot.
+
+    @param row_hash The SQL expression of the RowHash column, replaceable for a
+                    server other than SQL Server, such as a SQLite stand-in for tests.
+
+    @return A tuple (db_name, delta, seconds) where delta holds the number of
+            new, changed and removed rows, or is None if the extraction failed.
+    """
+    start = time.perf_counter()
+    columns = f"[CT_Num], [CT_Siret], [CT_Intitule], {row_hash}"
+    try:
+        connection = pool.get()
+        connection.cursor().execute(f"USE [{db_name}];")
+        known = store.hashes(db_name)
+        delta = {"new": 0, "changed": 0, "removed": 0}
+        if not known:
+            for chunk in read_chunks(f"SELECT {columns} FROM [F_COMPTET];", connection, chunksize):
+                store.apply(db_name, chunk)
+                delta["new"] += len(chunk)
+        else:
+            current = pd.read_sql(f"SELECT [CT_Num], {row_hash} FROM [F_COMPTET];", connection)
+            current = dict(zip(current['CT_Num'], current['RowHash']))
+            stale = [num for num, row_hash in current.items() if known.get(num) != row_hash]
+            removed = [num for num in known if num not in current]
+            for i in range(0, len(stale), DELTA_BATCH):
+                keys = stale[i:i + DELTA_BATCH]
+                query = f"SELECT {columns} FROM [F_COMPTET] WHERE [CT_Num] IN ({', '.join('?' * len(keys))});"
+                store.apply(db_name, pd.read_sql(query, connection, params=keys))
+            store.apply(db_name, pd.DataFrame(columns=['CT_Num', 'CT_Siret', 'CT_Intitule', 'RowHash']), removed)
+            delta["new"] = sum(num not in known for num in stale)
+            delta["changed"] = len(stale) - delta["new"]
+            delta["removed"] = len(removed)
+    except Exception as e:
+        print(f"Couldn't connect to the db: {str(e)}")
+        pool.discard()
+        delta = None
+    return db_name, delta, time.perf_counter() - start
+
+def export_snapshot(store, db_name, checksum=True):
+    """
+    @brief Appends the classified snapshot rows of a database to the CSV files.
+
+    @return The number of rows written per category.
+    """
+    return write_categories(*split_categories(store.classified(db_name)), checksum)
+
+# Workers append to the same CSV files
+write_lock = threading.Lock()
 
 def write_csv(client_info, type):
     """
@@ -111,17 +404,107 @@ def write_csv(client_info, type):
     The generated file will be named:
     - client_good_siret.csv
     - client_bad_siret.csv
-    - client_duplicate_siret.csv
+    - client_dup_siret.csv
+    - client_checksum_siret.csv
+
+    Every database appends to the same files; the header is only written
+    when the file is created.
 
     @note Ensure that the 'client_info' DataFrame has the columns:
           ['CT_Siret', 'CT_Num', 'CT_Intitule', 'DB_NAME'].
     """
-    client_info.to_csv(f'client_{type}_siret.csv', index=False, header=['CT_Siret', 'CT_Num', 'CT_Intitule', 'DB_NAME'])
+    path = f'client_{type}_siret.csv'
+    with write_lock:
+        exists = os.path.exists(path)
+        client_info.to_csv(path, mode='a', index=False,
+                           header=False if exists else ['CT_Siret', 'CT_Num', 'CT_Intitule', 'DB_NAME'])
 
 
-def main():
-    load_dotenv()
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Extract and classify the SIRET of every Sage database.")
+    parser.add_argument("--parallel", type=int, default=4,
+                        help="databases extracted at the same time, each worker reusing one connection")
+    parser.add_argument("--query-mode", choices=["single", "split", "local"], default="single",
+                        help="one classifying scan of F_COMPTET, the three original queries, "
+                             "or a plain scan classified in-process")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="stream rows from the cursor this many at a time straight to the CSV files")
+    parser.add_argument("--no-checksum", dest="checksum", action="store_false",
+                        help="trust every well-formed SIRET, without the checksum_fail category")
+    parser.add_argument("--delta", action="store_true",
+                        help="only fetch rows that changed since the last run, classified from a local snapshot")
+    parser.add_argument("--snapshot", default="siret_snapshot.sqlite",
+                        help="SQLite snapshot file of the delta mode")
+    return parser.parse_args(argv)
+
+def extract_deltas(databases, connect, args, row_hash=ROW_HASH):
+    """
+    @brief Delta mode of main: updates the snapshot, then writes every CSV file from it.
+
+    The files are rebuilt from the local snapshot, which costs no server
+    query, so duplicates stay right whatever rows were added or removed.
+    A database whose extraction fails keeps its rows from the last run.
+
+    @return The stats.json entries, in database order.
+    """
+    stats = {}
+    store = SnapshotStore(args.snapshot)
+    pool = ConnectionPool(connect)
+    try:
+        with ThreadPoolExecutor(max_workers=args.parallel) as executor:
+            futures = [executor.submit(extract_delta, db_name, pool, store, args.chunksize, row_hash)
+                       for db_name in databases]
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Processing databases"):
+                db_name, delta, seconds = future.result()
+                if delta is None:
+                    stats[db_name] = {"db_name": db_name, "error": "extraction failed, last snapshot kept"}
+                else:
+                    stats[db_name] = {"db_name": db_name, **delta}
+                stats[db_name]["seconds"] = round(seconds, 3)
+        for db_name in databases:
+            counts = export_snapshot(store, db_name, args.checksum)
+            stats[db_name].update(counts, total=sum(counts.values()))
+    finally:
+        pool.close()
+        store.close()
+    return [stats[db_name] for db_name in databases]
+
+def extract_all(databases, connect, args):
+    """
+    @brief Full mode of main: extracts and classifies every row of every database.
+
+    @return The stats.json entries, in database order.
+    """
     stats = []
+    pool = ConnectionPool(connect)
+    try:
+        with ThreadPoolExecutor(max_workers=args.parallel) as executor:
+            futures = [executor.submit(extract_database, db_name, pool, args.query_mode, args.chunksize, args.checksum)
+                       for db_name in databases]
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Processing databases"):
+                db_name, counts, seconds = future.result()
+                if counts is None:
+                    stats.append({"db_name": db_name, "error": "extraction failed", "seconds": round(seconds, 3)})
+                    continue
+
+                results = {
+                    "db_name": db_name,
+                    "good": counts["good"],
+                    "duplicate": counts["duplicate"],
+                    "bad": counts["bad"],
+                    "checksum_fail": counts["checksum_fail"],
+                    "total": sum(counts.values()),
+                    "seconds": round(seconds, 3),
+                }
+                stats.append(results)
+    finally:
+        pool.close()
+    stats.sort(key=lambda result: databases.index(result["db_name"]))
+    return stats
+
+def main(argv=None, connect=open_connection, row_hash=ROW_HASH):
+    args = parse_args(argv)
+    load_dotenv()
 
     try:
         databases = os.getenv("DB_NAMES").split(",")
@@ -129,28 +512,17 @@ def main():
         print("ERROR: No array of databases provided. Please check your environment variables.")
         exit(84)
 
-    files_to_check = ['client_good_siret.csv', 'client_duplicate_siret.csv', 'client_bad_siret.csv']
+    files_to_check = ['client_good_siret.csv', 'client_dup_siret.csv', 'client_bad_siret.csv', 'client_checksum_siret.csv']
 
     for file in files_to_check:
         if os.path.exists(file):
             os.remove(file)
             print(f"Removed: {file}")
 
-    for db_name in tqdm(databases, desc="Processing databases"):
-        good, dup, bad = get_filtered_siret(db_name)
-
-        write_csv(good, "good")
-        write_csv(dup, "dup")
-        write_csv(bad, "bad")
-
-        results = {
-            "db_name": db_name,
-            "good": len(good),
-            "duplicate": len(dup),
-            "bad": len(bad),
-            "total": len(good) + len(dup) + len(bad),
-        }
-        stats.append(results)
+    if args.delta:
+        stats = extract_deltas(databases, connect, args, row_hash)
+    else:
+        stats = extract_all(databases, connect, args)
 
     with open("stats.json", 'w') as json_file:
         json.dump(stats, json_file, indent=4)
@@ -0,0 +1,105 @@
+import time
+from collections import Counter
+import psutil
+from tqdm import tqdm
+from metrics import process_rss
+
+
+def default_budget(share=0.7):
+    """`share` of the machine's memory, the threshold the old monitor_memory loop used."""
+    return int(psutil.virtual_memory().total * share)
+
+
+class MemoryGovernor:
+    """
+    @brief Keeps the matcher's RSS under a budget by adapting how much work is in flight.
+
+    The drain loop calls check() after every result. At most every `interval`
+    seconds it reads metrics.process_rss: the RSS of the process plus the
+    private memory of its pool workers:
+
+    - over the budget, the in-flight limit is halved (down to 1) and the
+      output sink is flushed, so the rows waiting in its buffers and queue
+      go to disk instead of memory;
+    - under `low_water` times the budget, the limit grows back by one task,
+      up to the configured maximum.
+
+    The limit changes at most once every `cooldown` seconds, so the memory
+    freed by a shrink shows before the next decision. RSS can stay over the
+    budget at limit 1, from the interpreter, store and scorer footprint or
+    arenas CPython keeps: this is reported once, and the sink is then only
+    flushed when rows are waiting in its queue.
+
+    check() runs in the drain loop, between two results: it cannot react
+    while a long shard is running, smaller shards make it react sooner.
+
+    bounded_map reads the current limit by calling the governor. Every change
+    is written above the progress bar, and published to the metrics as the
+    in_flight_limit and memory_budget_bytes gauges and the memory_shrinks /
+    memory_flushes counts.
+    """
+
+    def __init__(self, budget, max_in_flight, sink=None, metrics=None, interval=0.5, low_water=0.8, cooldown=5.0):
+        """
+        @param budget The RSS budget, in bytes.
+        @param max_in_flight The in-flight limit the governor starts from and never exceeds.
+        @param sink The OutputSink flushed when over budget.
+        @param metrics The metrics.Metrics the limits are published to.
+        @param cooldown Minimum number of seconds between two changes of the limit.
+        """
+        self.budget = budget
+        self.max_in_flight = max_in_flight
+        self.limit = max_in_flight
+        self.sink = sink
+        self.metrics = metrics
+        self.interval = interval
+        self.low_water = low_water
+        self.cooldown = cooldown
+        self._last_check = 0.0
+        self._last_change = float('-inf')
+        self._floor_reported = False
+        if metrics is not None:
+            metrics.gauge('memory_budget_bytes', budget)
+            metrics.gauge('in_flight_limit', lambda: self.limit)
+
+    def __call__(self):
+        return self.limit
+
+    def check(self):
+        now = time.monotonic()
+        if now - self._last_check < self.interval:
+            return
+        self._last_check = now
+        rss = process_rss()
+        if rss > self.budget:
+            if self.limit > 1 and now - self._last_change >= self.cooldown:
+                self._shrink(rss)
+                self._last_change = now
+            elif self.limit == 1:
+                self._at_floor(rss)
+        elif rss < self.low_water * self.budget and self.limit < self.max_in_flight \
+                and now - self._last_change >= self.cooldown:
+            self.limit += 1
+            self._last_change = now
+
+    def _shrink(self, rss):
+        previous = self.limit
+        self.limit = max(1, self.limit // 2)
+        tqdm.write(f"memory governor: RSS {rss / 2 ** 20:.0f} MB over the {self.budget / 2 ** 20:.0f} MB budget, "
+                   f"in-flight limit {previous} -> {self.limit}, flushing the output")
+        self._flush(Counter(memory_shrinks=1))
+
+    def _at_floor(self, rss):
+        if not self._floor_reported:
+            self._floor_reported = True
+            tqdm.write(f"memory governor: WARNING RSS {rss / 2 ** 20:.0f} MB still over the "
+                       f"{self.budget / 2 ** 20:.0f} MB budget at in-flight limit 1, the budget cannot be met")
+        if self.sink is not None and self.sink.backlog():
+            self._flush(Counter())
+
+    def _flush(self, events):
+        if self.sink is not None:
+            self.sink.flush()
+            events['memory_flushes'] += 1
+        if self.metrics is not None:
+            self.metrics.add(events)
@@ -0,0 +1,175 @@
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+import psutil
+
+
+def process_rss():
+    """
+    @brief Resident memory of this process and of its children (the process pool workers), in bytes.
+
+    The children count for their unique set size: the pages of the stores and
+    scorer they map are shared, and are already in the RSS of the parent that
+    wrote them, so summing every worker's RSS would count them once per worker.
+    A child whose USS cannot be read counts for its RSS.
+    """
+    process = psutil.Process()
+    rss = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            try:
+                rss += child.memory_full_info().uss
+            except psutil.AccessDenied:
+                rss += child.memory_info().rss
+        except psutil.Error:
+            pass
+    return rss
+
+
+class Metrics:
+    """
+    @brief Thread-safe registry of the run's stage timers, counters and gauges.
+
+    - stages         : wall-clock seconds per named stage (load, index, score, write...)
+    - worker_seconds : seconds per stage added up over the workers, which run
+                       at the same time: above the wall time with several workers
+    - counters       : cumulative counts, merged from the Counters the workers return
+    - gauges         : current values, either set or read from a callable at snapshot time
+
+    A counter `calls:<scorer>` / `seconds:<scorer>` pair is reported as the
+    call count and cumulative time of that scorer.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._stages = defaultdict(float)
+        self._worker_seconds = defaultdict(float)
+        self._counters = Counter()
+        self._gauges = {}
+
+    @contextmanager
+    def stage(self, name):
+        """Adds the time spent inside the with block to the `name` stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self._stages[name] += seconds
+
+    def add(self, counts):
+        """Merges a Counter, such as the counts of a shard. `seconds:worker:<name>` entries go to the worker seconds."""
+        with self._lock:
+            for key, value in counts.items():
+                if key.startswith('seconds:worker:'):
+                    self._worker_seconds[key[len('seconds:worker:'):]] += value
+                else:
+                    self._counters[key] += value
+
+    def gauge(self, name, value):
+        """Sets a gauge to a value, or to a callable read at every snapshot."""
+        with self._lock:
+            self._gauges[name] = value
+
+    def snapshot(self, rate_counter='scored'):
+        """
+        @return A JSON-ready dict: uptime, stages, worker seconds, scorers, counters, gauges,
+                the RSS and the rate of `rate_counter` per second since the start.
+        """
+        with self._lock:
+            stages = dict(self._stages)
+            worker_seconds = dict(self._worker_seconds)
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+        uptime = time.monotonic() - self.started
+        scorers = {}
+        for key, value in counters.items():
+            kind, _, scorer = key.partition(':')
+            if kind in ('calls', 'seconds') and scorer:
+                scorers.setdefault(scorer, {'calls': 0, 'seconds': 0.0})[kind] = value
+        return {
+            'timestamp': time.time(),
+            'uptime': uptime,
+            'stages': stages,
+            'worker_seconds': worker_seconds,
+            'scorers': scorers,
+            'counters': {key: value for key, value in counters.items() if ':' not in key},
+            'gauges': {name: value() if callable(value) else value for name, value in gauges.items()},
+            'rss_bytes': process_rss(),
+            f'{rate_counter}_per_sec': counters.get(rate_counter, 0) / uptime if uptime else 0.0,
+        }
+
+
+def prometheus_text(snapshot, prefix='enterprise_finder'):
+    """Renders a snapshot in the Prometheus text exposition format, for the node exporter textfile collector."""
+    lines = [f'{prefix}_uptime_seconds {snapshot["uptime"]}',
+             f'{prefix}_rss_bytes {snapshot["rss_bytes"]}']
+    for name, seconds in snapshot['stages'].items():
+        lines.append(f'{prefix}_stage_seconds{{stage="{name}"}} {seconds}')
+    for name, seconds in snapshot['worker_seconds'].items():
+        lines.append(f'{prefix}_worker_seconds_total{{stage="{name}"}} {seconds}')
+    for name, scorer in snapshot['scorers'].items():
+        lines.append(f'{prefix}_scorer_calls_total{{scorer="{name}"}} {scorer["calls"]}')
+        lines.append(f'{prefix}_scorer_seconds_total{{scorer="{name}"}} {scorer["seconds"]}')
+    for name, value in snapshot['counters'].items():
+        lines.append(f'{prefix}_{name}_total {value}')
+    for name, value in snapshot['gauges'].items():
+        lines.append(f'{prefix}_{name} {value}')
+    for key, value in snapshot.items():
+        if key.endswith('_per_sec'):
+            lines.append(f'{prefix}_{key[:-len("_per_sec")]}_per_second {value}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsSampler:
+    """
+    @brief Writes a snapshot of a Metrics every `interval` seconds from a background thread.
+
+    The "jsonl" format appends one JSON object per line, the "prometheus"
+    format atomically replaces a textfile with the latest snapshot. A last
+    snapshot is written on stop().
+    """
+
+    def __init__(self, metrics, path, fmt='jsonl', interval=5.0):
+        self.metrics = metrics
+        self.path = path
+        self.fmt = fmt
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self):
+        snapshot = self.metrics.snapshot()
+        if self.fmt == 'prometheus':
+            with open(self.path + '.tmp', 'w') as textfile:
+                textfile.write(prometheus_text(snapshot))
+            os.replace(self.path + '.tmp', self.path)
+        else:
+            with open(self.path, 'a') as jsonl_file:
+                jsonl_file.write(json.dumps(snapshot) + '\n')
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+        self.write()
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import numpy as np
+from name_store import bigram_hashes, csr_gather
+
+EMPTY = np.uint32(0xFFFFFFFF)
+
+
+def hash_parameters(count, seed):
+    """
+    Multiply-shift hash functions h(x) = ((a * x + b) mod 2^64) >> 32, one per
+    signature row, and the odd multipliers mixing the rows of a band into its key.
+
+    Each comes from its own stream, so the parameters of the first rows do not
+    depend on `count` and a wider signature starts with a narrower one.
+    """
+    a, b, mix = (np.random.default_rng([seed, stream]).integers(0, 2 ** 63, count, dtype=np.uint64)
+                 for stream in range(3))
+    return a * np.uint64(2) + np.uint64(1), b, mix * np.uint64(2) + np.uint64(1)
+
+def signatures(offsets, shingles, count, seed=0, chunk=1 << 20):
+    """
+    @brief MinHash signatures of sets of uint32 shingles, CSR style, without a Python loop per set.
+
+    Every hash function is applied to every shingle at once, a chunk of sets
+    at a time so at most about `chunk` hashes are in memory, and the minimum
+    of each set is taken with np.minimum.reduceat. Empty sets get EMPTY.
+
+    @return A (sets, count) uint32 matrix.
+    """
+    a, b, _ = hash_parameters(count, seed)
+    sizes = np.diff(offsets)
+    out = np.full((len(sizes), count), EMPTY, dtype=np.uint32)
+    first = 0
+    while first < len(sizes):
+        # Sets until about `chunk` hashes, at least one set
+        budget = offsets[first] + max(chunk // count, 1)
+        last = max(int(np.searchsorted(offsets, budget, side='right')) - 1, first + 1)
+        last = min(last, len(sizes))
+        rows = np.flatnonzero(sizes[first:last]) + first
+        if len(rows):
+            values = shingles[offsets[first]:offsets[last]].astype(np.uint64)
+            hashed = ((a[:, None] * values[None, :] + b[:, None]) >> np.uint64(32)).astype(np.uint32)
+            out[rows] = np.minimum.reduceat(hashed, offsets[rows] - offsets[first], axis=1).T
+        first = last
+    return out
+
+def band_keys(signature, bands, rows, seed=0):
+    """One uint64 key per band of every signature, a random linear mix of its `rows` values."""
+    _, _, mix = hash_parameters(bands * rows, seed)
+    values = signature[:, :bands * rows].astype(np.uint64).reshape(len(signature), bands, rows)
+    return (values * mix[:rows]).sum(axis=2, dtype=np.uint64)
+
+def names_fingerprint(store):
+    """SHA-1 of the distinct names of a NameStore, in name id order: signatures are only reused for the same names."""
+    names = store.columns[store.name_column]
+    digest = hashlib.sha1(np.ascontiguousarray(names.offsets).tobytes())
+    digest.update(np.ascontiguousarray(names.text).tobytes())
+    return digest.hexdigest()
+
+
+class MinHashIndex:
+    """
+    @brief MinHash LSH index over the distinct raw bigrams of the names of a NameStore.
+
+    Each distinct name gets a signature of `bands` x `rows` MinHash values,
+    and is filed in one bucket per band, keyed on that band of its signature.
+    A query name is a candidate of the names it shares at least one bucket
+    with. The probability that two names meet is 1 - (1 - J^rows)^bands for a
+    bigram Jaccard J. More bands raise recall, more rows cut the pairs.
+
+    Buckets are flat arrays: the sorted keys of every band, one after the
+    other, and uint32 postings of name ids, CSR style, expanded to record ids
+    through the store. save() and cached() keep the signatures on disk,
+    so they are only computed again when the good names change.
+    """
+
+    ARRAYS = ('signature', 'bucket_keys', 'band_starts', 'bucket_offsets', 'postings')
+
+    def __init__(self, store, bands, rows, seed, arrays):
+        self.store = store
+        self.bands = bands
+        self.rows = rows
+        self.seed = seed
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def build(cls, store, bands=32, rows=3, seed=0, signature=None):
+        """
+        @param signature Signatures of the store names computed earlier with the
+                         same seed, at least bands x rows wide, to only rebuild the buckets.
+        """
+        if signature is None:
+            signature = signatures(store.bigram_offsets, store.bigram_hashes, bands * rows, seed)
+        keys = band_keys(signature, bands, rows, seed)
+        bucket_keys, band_starts, counts, postings = [], [0], [], []
+        for band in range(bands):
+            order = np.argsort(keys[:, band], kind='stable')
+            unique, band_counts = np.unique(keys[order, band], return_counts=True)
+            bucket_keys.append(unique)
+            band_starts.append(band_starts[-1] + len(unique))
+            counts.append(band_counts)
+            postings.append(order.astype(np.uint32))
+        bucket_offsets = np.zeros(band_starts[-1] + 1, dtype=np.int64)
+        np.cumsum(np.concatenate(counts), out=bucket_offsets[1:])
+        arrays = {
+            'signature': signature,
+            'bucket_keys': np.concatenate(bucket_keys),
+            'band_starts': np.array(band_starts, dtype=np.int64),
+            'bucket_offsets': bucket_offsets,
+            'postings': np.concatenate(postings),
+        }
+        return cls(store, bands, rows, seed, arrays)
+
+    def save(self, path):
+        """Writes every file through a temporary one, so indexes still mapping the previous files keep them intact."""
+        os.makedirs(path, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(path, f'{name}.tmp.npy'), getattr(self, name))
+            os.replace(os.path.join(path, f'{name}.tmp.npy'), os.path.join(path, f'{name}.npy'))
+        with open(os.path.join(path, 'minhash.json.tmp'), 'w') as meta_file:
+            json.dump({'bands': self.bands, 'rows': self.rows, 'seed': self.seed,
+                       'fingerprint': names_fingerprint(self.store)}, meta_file)
+        os.replace(os.path.join(path, 'minhash.json.tmp'), os.path.join(path, 'minhash.json'))
+
+    @classmethod
+    def cached(cls, store, path, bands=32, rows=3, seed=0):
+        """
+        @brief The index saved at `path` if it was built for the same names and settings, a new one otherwise.
+
+        A saved index of the same names and seed with other bands or rows
+        lends its signatures when they are wide enough. A new index is saved
+        at `path`, memory-mapped arrays are returned either way.
+        """
+        meta = None
+        if os.path.exists(os.path.join(path, 'minhash.json')):
+            with open(os.path.join(path, 'minhash.json')) as meta_file:
+                meta = json.load(meta_file)
+        if meta is None or meta['fingerprint'] != names_fingerprint(store) or meta['seed'] != seed:
+            cls.build(store, bands, rows, seed).save(path)
+        elif (meta['bands'], meta['rows']) != (bands, rows):
+            signature = np.load(os.path.join(path, 'signature.npy'))
+            cls.build(store, bands, rows, seed, signature if signature.shape[1] >= bands * rows else None).save(path)
+        arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in cls.ARRAYS}
+        return cls(store, bands, rows, seed, arrays)
+
+    def query(self, names):
+        """
+        @brief Candidate records of a batch of names, all bands probed at once per band.
+
+        @return One list of record ids per name.
+        """
+        offsets, shingles = bigram_hashes(list(names))
+        keys = band_keys(signatures(offsets, shingles, self.bands * self.rows, self.seed),
+                         self.bands, self.rows, self.seed)
+        query_ids, name_ids = [], []
+        for band in range(self.bands):
+            start, end = self.band_starts[band], self.band_starts[band + 1]
+            table = self.bucket_keys[start:end]
+            if not len(table):
+                continue
+            positions = np.minimum(np.searchsorted(table, keys[:, band]), len(table) - 1)
+            hit = table[positions] == keys[:, band]
+            positions = positions[hit] + start
+            sizes = self.bucket_offsets[positions + 1] - self.bucket_offsets[positions]
+            query_ids.append(np.repeat(np.flatnonzero(hit), sizes))
+            name_ids.append(csr_gather(self.bucket_offsets, self.postings, positions).astype(np.int64))
+        pairs = np.unique((np.concatenate(query_ids or [np.zeros(0, dtype=np.int64)]) << 32)
+                          | np.concatenate(name_ids or [np.zeros(0, dtype=np.int64)]))
+        query_ids, name_ids = pairs >> 32, pairs & 0xFFFFFFFF
+        record_offsets = self.store.record_offsets
+        records = csr_gather(record_offsets, self.store.name_records, name_ids)
+        query_ids = np.repeat(query_ids, record_offsets[name_ids + 1] - record_offsets[name_ids])
+        bounds = np.searchsorted(query_ids, np.arange(len(offsets)))
+        return [records[bounds[i]:bounds[i + 1]].tolist() for i in range(len(offsets) - 1)]
@@ -0,0 +1,58 @@
+import re
+import unicodedata
+import pandas as pd
+
+
+# Legal forms and their abbreviations, dropped from the canonical key wherever they appear
+LEGAL_FORMS = frozenset({
+    'SARL', 'SAS', 'SASU', 'EURL', 'SA', 'SCI', 'SNC', 'EI', 'EIRL', 'SCOP', 'SELARL', 'SCP', 'SCM', 'GIE',
+    'SOCIETE', 'ETS', 'ETABLISSEMENTS',
+})
+# Abbreviations only dropped as a standalone first word: "Sté Dupont", but not "Ste-Marie BTP" or "BTP Ste Marie"
+LEADING_FORMS = frozenset({'STE'})
+# Ligatures NFKD leaves whole
+_LIGATURES = str.maketrans({'Œ': 'OE', 'œ': 'oe', 'Æ': 'AE', 'æ': 'ae'})
+_INITIAL_DOT = re.compile(r'\b(\w)\.')
+_NOT_ALNUM = re.compile(r'[^0-9A-Z]+')
+
+
+def canonical_key(name):
+    """
+    @brief Canonical key of a company name, equal for names that only differ
+           by case, accents, punctuation, spacing or a legal form.
+
+    "Sté Dupont & Fils, S.A.R.L." and "DUPONT FILS" both give "DUPONT FILS",
+    "Œuvre" and "OEUVRE" both give "OEUVRE".
+
+    @return The key, empty when nothing but a legal form is left.
+    """
+    decomposed = unicodedata.normalize('NFKD', name.translate(_LIGATURES))
+    name = ''.join(char for char in decomposed if not unicodedata.combining(char)).upper()
+    words = name.split(None, 1)
+    if words and '-' not in words[0] and _NOT_ALNUM.sub('', words[0]) in LEADING_FORMS:
+        name = words[1] if len(words) > 1 else ''
+    name = _NOT_ALNUM.sub(' ', _INITIAL_DOT.sub(r'\1', name))
+    return ' '.join(token for token in name.split() if token not in LEGAL_FORMS)
+
+def canonical_keys(names):
+    """
+    @brief Canonical key of every name of a column, computed once per distinct name.
+
+    @param names A Series of names. Missing names get an empty key.
+    @return A Series of keys aligned on `names`.
+    """
+    distinct = names.dropna().unique()
+    keys = dict(zip(distinct, (canonical_key(str(name)) for name in distinct)))
+    return names.map(keys).fillna('')
+
+def exact_join(good_names, bad_names):
+    """
+    @brief Hash join of two name columns on their canonical key.
+
+    @return A DataFrame of (good_id, bad_id) pairs, row positions, for every
+            good and bad record sharing a non-empty key, sorted by bad id then good id.
+    """
+    good = pd.DataFrame({'key': canonical_keys(good_names).to_numpy(), 'good_id': range(len(good_names))})
+    bad = pd.DataFrame({'key': canonical_keys(bad_names).to_numpy(), 'bad_id': range(len(bad_names))})
+    pairs = bad[bad['key'] != ''].merge(good[good['key'] != ''], on='key')
+    return pairs[['good_id', 'bad_id']].sort_values(['bad_id', 'good_id'], ignore_index=True)
@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+from collections.abc import Sequence
+import numpy as np
+import pandas as pd
+
+
+def csr_gather(offsets, values, rows):
+    """Concatenation of the values[offsets[row]:offsets[row + 1]] slices of `rows`, without a Python loop."""
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = offsets[rows].astype(np.int64)
+    lengths = offsets[rows + 1].astype(np.int64) - starts
+    total = int(lengths.sum())
+    if not total:
+        return values[:0]
+    shifts = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return values[np.arange(total, dtype=np.int64) + shifts]
+
+def code_points(strings):
+    """
+    @brief The code points of every string, in one flat uint32 array.
+
+    @return The array and the (len + 1) offsets of each string in it.
+    """
+    lengths = np.fromiter((len(string) for string in strings), dtype=np.int64, count=len(strings))
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    codes = np.frombuffer(''.join(strings).encode('utf-32-le'), dtype=np.uint32)
+    return codes, offsets
+
+def bigram_hashes(strings):
+    """
+    @brief Sorted distinct bigram hashes of every string, CSR style.
+
+    A bigram (a, b) hashes to (a << 16) ^ b on 32 bits, which is exact for
+    the characters below U+10000 and may collide beyond. The bigrams are the
+    raw, case-sensitive windows of name_bigrams in enterprise_finder.
+
+    @return The (len + 1) offsets and the uint32 hashes.
+    """
+    codes, offsets = code_points(strings)
+    if len(codes) < 2:
+        return np.zeros(len(strings) + 1, dtype=np.int64), np.zeros(0, dtype=np.uint32)
+    owners = np.repeat(np.arange(len(strings), dtype=np.int64), np.diff(offsets))
+    inside = owners[:-1] == owners[1:]
+    hashes = (codes[:-1] << np.uint32(16)) ^ codes[1:]
+    keys = np.unique((owners[:-1][inside] << 32) | hashes[inside].astype(np.int64))
+    bigram_offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys >> 32, minlength=len(strings)), out=bigram_offsets[1:])
+    return bigram_offsets, (keys & 0xFFFFFFFF).astype(np.uint32)
+
+def cell_text(value):
+    """The text csv.writer writes for a cell, so rows read back from a store write out unchanged."""
+    return '' if value is None else value if isinstance(value, str) else str(value)
+
+
+class StringColumn:
+    """
+    @brief An interned string column: a uint32 code per record into a table of distinct values.
+
+    The distinct values are stored as one UTF-8 buffer and their offsets, so
+    the column holds no Python object and can be memory-mapped.
+    """
+
+    def __init__(self, codes, offsets, text):
+        self.codes = codes
+        self.offsets = offsets
+        self.text = text
+
+    @classmethod
+    def build(cls, values):
+        codes, uniques = pd.factorize(pd.Series([cell_text(value) for value in values], dtype=object))
+        encoded = [value.encode('utf-8') for value in uniques]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        text = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return cls(codes.astype(np.uint32), offsets, text)
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def unique_count(self):
+        return len(self.offsets) - 1
+
+    def unique(self, code):
+        return self.text[self.offsets[code]:self.offsets[code + 1]].tobytes().decode('utf-8')
+
+    def __getitem__(self, record_id):
+        return self.unique(self.codes[record_id])
+
+
+class _Names(Sequence):
+    """Read-only sequence of the names of a NameStore, by record id, decoded on access."""
+
+    def __init__(self, column):
+        self._column = column
+
+    def __len__(self):
+        return len(self._column)
+
+    def __getitem__(self, record_id):
+        return self._column[record_id]
+
+
+class NameStore:
+    """
+    @brief Compact, array-backed store of the records of one side of the matcher.
+
+    - every column of `columns` is a StringColumn, the cells as csv.writer writes them
+    - names (`name_column`) are interned, so the records sharing a name share its id
+    - the distinct bigram hashes of each interned name are kept CSR style,
+      and inverted into postings from bigram hash to name ids: the blocking index
+    - `name_records` maps each name id back to its records, CSR style too
+
+    Everything is a flat NumPy array. save() writes them as .npy files and
+    attach() maps them read-only, so the process workers share one copy of
+    the pages instead of each unpickling its own rows, names and index.
+    """
+
+    ARRAYS = ('bigram_offsets', 'bigram_hashes', 'index_keys', 'index_offsets', 'index_postings',
+              'record_offsets', 'name_records')
+
+    def __init__(self, columns, name_column, arrays):
+        self.columns = columns
+        self.name_column = name_column
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.names = _Names(columns[name_column])
+
+    @classmethod
+    def build(cls, frame, columns, name_column='CT_Intitule'):
+        """
+        @param frame The records, a DataFrame.
+        @param columns The columns to keep, in the order row() returns them.
+        @param name_column The column the names are matched on.
+        """
+        store_columns = {column: StringColumn.build(frame[column].tolist()) for column in columns}
+        names = store_columns[name_column]
+        uniques = [names.unique(code) for code in range(names.unique_count)]
+        bigram_offsets, hashes = bigram_hashes(uniques)
+        owners = np.repeat(np.arange(len(uniques), dtype=np.uint32), np.diff(bigram_offsets))
+        order = np.argsort(hashes, kind='stable')
+        index_keys, counts = np.unique(hashes[order], return_counts=True)
+        index_offsets = np.zeros(len(index_keys) + 1, dtype=np.int64)
+        np.cumsum(counts, out=index_offsets[1:])
+        record_offsets = np.zeros(len(uniques) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(names.codes, minlength=len(uniques)), out=record_offsets[1:])
+        arrays = {
+            'bigram_offsets': bigram_offsets,
+            'bigram_hashes': hashes,
+            'index_keys': index_keys,
+            'index_offsets': index_offsets,
+            'index_postings': owners[order],
+            'record_offsets': record_offsets,
+            'name_records': np.argsort(names.codes, kind='stable').astype(np.uint32),
+        }
+        return cls(store_columns, name_column, arrays)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(path, f'{name}.npy'), getattr(self, name))
+        for column_name, column in self.columns.items():
+            for part in ('codes', 'offsets', 'text'):
+                np.save(os.path.join(path, f'{column_name}.{part}.npy'), getattr(column, part))
+        with open(os.path.join(path, 'store.json'), 'w') as meta_file:
+            json.dump({'columns': list(self.columns), 'name_column': self.name_column}, meta_file)
+
+    @classmethod
+    def attach(cls, path):
+        """Maps a saved store read-only, zero-copy: pages are loaded on access and shared between processes."""
+        def load(name):
+            return np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+        with open(os.path.join(path, 'store.json')) as meta_file:
+            meta = json.load(meta_file)
+        columns = {column: StringColumn(*(load(f'{column}.{part}') for part in ('codes', 'offsets', 'text')))
+                   for column in meta['columns']}
+        return cls(columns, meta['name_column'], {name: load(name) for name in cls.ARRAYS})
+
+    def __len__(self):
+        return len(self.names)
+
+    def fingerprint(self):
+        """
+        @brief SHA-1 of every cell of the store, column by column in record order.
+
+        Unlike minhash_lsh.names_fingerprint, which only covers the distinct
+        names, it changes with any SIRET, number or database of a record,
+        and with the order of the records.
+        """
+        digest = hashlib.sha1()
+        for column_name, column in self.columns.items():
+            digest.update(column_name.encode('utf-8'))
+            for part in (column.codes, column.offsets, column.text):
+                digest.update(np.ascontiguousarray(part).tobytes())
+        return digest.hexdigest()
+
+    def row(self, record_id):
+        """The cells of a record, in the order of the columns."""
+        return tuple(column[record_id] for column in self.columns.values())
+
+    def candidates(self, to_find, min_shared=3):
+        """
+        @brief Ids of the records whose name shares at least `min_shared` distinct bigrams with `to_find`.
+
+        The threshold is capped by the number of bigrams `to_find` has, so very
+        short names still get candidates, as in enterprise_finder's bigram blocking.
+
+        @return A list of record ids.
+        """
+        _, hashes = bigram_hashes([to_find])
+        needed = max(1, min(min_shared, len(hashes)))
+        positions = np.searchsorted(self.index_keys, hashes)
+        found = positions < len(self.index_keys)
+        positions = positions[found]
+        positions = positions[self.index_keys[positions] == hashes[found]]
+        if not len(positions):
+            return []
+        name_ids, shared = np.unique(csr_gather(self.index_offsets, self.index_postings, positions),
+                                     return_counts=True)
+        return csr_gather(self.record_offsets, self.name_records, name_ids[shared >= needed]).tolist()
@@ -0,0 +1,162 @@
+import csv
+import os
+import queue
+import threading
+import time
+
+
+class OutputSink:
+    """
+    @brief Single writer for the category CSV files of the matcher.
+
+    Rows are handed over through a queue and written by one dedicated thread
+    that keeps every `{category}.csv` open. Rows are buffered per category
+    and written in batches, at most `flush_interval` seconds apart, or
+    earlier when a buffer holds `batch_size` rows. Scoring workers never
+    touch the filesystem.
+
+    If the writer thread fails, a full disk or a row of an unknown category,
+    its exception is raised again by the next put, put_many, flush or close,
+    and the flushes it was serving return instead of waiting forever.
+    """
+
+    def __init__(self, categories, header, flush_interval=1.0, batch_size=5000, metrics=None):
+        """
+        @param categories The categories to open a `{category}.csv` file for.
+        @param header The header row written at the top of every file.
+        @param flush_interval Maximum number of seconds a row waits in memory before it is written.
+        @param batch_size Number of buffered rows of one category that triggers an early write.
+        @param metrics A metrics.Metrics the writing time is added to, as the "write" stage.
+        """
+        self.categories = list(categories)
+        self.header = header
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.metrics = metrics
+        self._queue = queue.Queue()
+        self._buffers = {category: [] for category in self.categories}
+        self._files = {}
+        self._writers = {}
+        # Orders hand-overs with the failure of the writer thread, so no flush waits on a dead thread
+        self._lock = threading.Lock()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self, offsets=None):
+        """
+        @brief Opens the files and starts the writer thread.
+
+        @param offsets Byte size of each file as returned by offsets(), to resume
+                       a run: every file is cut back to it and appended to.
+                       Without offsets the files are truncated and get a header.
+        """
+        for category in self.categories:
+            path = f'{category}.csv'
+            if offsets is None:
+                self._files[category] = open(path, mode='w', newline='')
+                self._writers[category] = csv.writer(self._files[category])
+                self._writers[category].writerow(self.header)
+            else:
+                os.truncate(path, offsets[category])
+                self._files[category] = open(path, mode='a', newline='')
+                self._writers[category] = csv.writer(self._files[category])
+        self._thread.start()
+
+    def put(self, category, row):
+        self._hand_over([(category, row)])
+
+    def put_many(self, rows):
+        """Queues a batch of (category, row) pairs in one hand-over."""
+        self._hand_over(list(rows))
+
+    def flush(self):
+        """Blocks until every row put so far is written and flushed to the files."""
+        done = threading.Event()
+        self._hand_over(done)
+        done.wait()
+        self._raise_error()
+
+    def backlog(self):
+        """Number of batches put and not yet taken by the writer thread."""
+        return self._queue.qsize()
+
+    def offsets(self):
+        """Byte size of every file, call right after flush() with no put() in between."""
+        return {category: os.fstat(df.fileno()).st_size for category, df in self._files.items()}
+
+    def close(self):
+        with self._lock:
+            if self._error is None:
+                self._queue.put(None)
+        self._thread.join()
+        for df in self._files.values():
+            df.close()
+        self._raise_error()
+
+    def _hand_over(self, item):
+        with self._lock:
+            self._raise_error()
+            self._queue.put(item)
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def _write(self):
+        start = time.perf_counter()
+        for category, rows in self._buffers.items():
+            if rows:
+                self._writers[category].writerows(rows)
+                rows.clear()
+        for df in self._files.values():
+            df.flush()
+        self._timed(start)
+
+    def _timed(self, start):
+        if self.metrics is not None:
+            self.metrics.add_time('write', time.perf_counter() - start)
+
+    def _run(self):
+        deadline = time.monotonic() + self.flush_interval
+        item = None
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    item = ()
+                if item is None:
+                    self._write()
+                    return
+                if isinstance(item, threading.Event):
+                    self._write()
+                    item.set()
+                else:
+                    for category, row in item:
+                        buffer = self._buffers[category]
+                        buffer.append(row)
+                        if len(buffer) >= self.batch_size:
+                            start = time.perf_counter()
+                            self._writers[category].writerows(buffer)
+                            buffer.clear()
+                            self._timed(start)
+                if time.monotonic() >= deadline:
+                    self._write()
+                    deadline = time.monotonic() + self.flush_interval
+        except BaseException as error:
+            # Nothing is taken from the queue any more: release every flush waiting in it
+            with self._lock:
+                self._error = error
+                pending = [item]
+                while not self._queue.empty():
+                    pending.append(self._queue.get_nowait())
+            for item in pending:
+                if isinstance(item, threading.Event):
+                    item.set()
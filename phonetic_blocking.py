@@ -0,0 +1,107 @@
+import numpy as np
+from name_normalizer import LEGAL_FORMS, canonical_key
+from name_store import csr_gather
+
+
+# French spellings of one sound that the consonant classes do not already merge.
+# CH, QU, CK, GU, GE, CE... need no rewrite: C, G, J, K, Q and S share a class, and vowels and H have no code.
+REWRITES = (
+    ('PH', 'F'),
+)
+# Consonant classes, wide enough to absorb name_finder.phonetic_misspell: c/k/s, s/z, t/d/c, l/r/w, n/m.
+# Vowels, Y and H have no code.
+CONSONANT_CLASSES = {
+    letter: code
+    for letters, code in (('BP', 'P'), ('CDGJKQSTXZ', 'K'), ('LRW', 'L'), ('MN', 'N'), ('FV', 'F'))
+    for letter in letters
+}
+
+
+def phonetic_code(word):
+    """
+    @brief Phonex-style code of one uppercase, unaccented word.
+
+    PH is rewritten F, then every consonant is replaced by its class and runs
+    of a class collapse into one code, so vowel swaps, a dropped h, a c
+    written k, s or t, or ch written s give the same code. Digits are kept.
+    A word without consonant codes to "A".
+    """
+    for spelling, sound in REWRITES:
+        word = word.replace(spelling, sound)
+    codes = []
+    previous = None
+    for char in word:
+        code = char if char.isdigit() else CONSONANT_CLASSES.get(char)
+        if code is not None and code != previous:
+            codes.append(code)
+        if code is not None:
+            previous = code
+    return ''.join(codes) or 'A'
+
+# Codes of the legal forms. Short words coding the same (DE, DU, LA...) are dropped with them.
+FORM_CODES = frozenset(phonetic_code(form) for form in LEGAL_FORMS)
+
+def phonetic_key(name):
+    """
+    @brief Phonetic key of a company name: the codes of its words, legal forms left out.
+
+    The words are those of name_normalizer.canonical_key. Words coding like a
+    legal form are only dropped when another word remains, so a misspelled
+    "SERL" is dropped as "SARL" is, but a name made of short words keeps them.
+    """
+    codes = [phonetic_code(word) for word in canonical_key(name).split()]
+    kept = [code for code in codes if code not in FORM_CODES]
+    return ''.join(kept or codes)
+
+def neighbour_keys(key, distance=1):
+    """The key itself, and at distance 1 every key with one code deleted: the neighbouring buckets."""
+    keys = {key}
+    if distance:
+        keys.update(key[:i] + key[i + 1:] for i in range(len(key)))
+    return keys
+
+
+class PhoneticIndex:
+    """
+    @brief Blocking index from phonetic key to the records of a NameStore.
+
+    Every distinct name of the store is keyed once. At distance 1 a name is
+    also filed under its keys with one code deleted, and a query probes its
+    own deletions, so two names meet when their keys are at most one
+    inserted, deleted or substituted code apart. At distance 0 only names of
+    the same key meet.
+
+    Buckets are a sorted array of keys and uint32 postings of name ids, CSR
+    style, expanded to record ids through the store.
+    """
+
+    def __init__(self, store, distance=1):
+        self.store = store
+        self.distance = distance
+        names = store.columns[store.name_column]
+        entries = [(variant, name_id)
+                   for name_id in range(names.unique_count)
+                   for variant in neighbour_keys(phonetic_key(names.unique(name_id)), distance)]
+        variants = np.array([variant for variant, _ in entries], dtype=str)
+        name_ids = np.array([name_id for _, name_id in entries], dtype=np.uint32)
+        order = np.argsort(variants, kind='stable')
+        self.keys, counts = np.unique(variants[order], return_counts=True)
+        self.offsets = np.zeros(len(self.keys) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+        self.postings = name_ids[order]
+
+    def candidates(self, to_find):
+        """
+        @brief Ids of the records in the same or a neighbouring bucket as `to_find`.
+
+        @return A list of record ids.
+        """
+        probes = np.array(sorted(neighbour_keys(phonetic_key(to_find), self.distance)), dtype=str)
+        positions = np.searchsorted(self.keys, probes)
+        found = positions < len(self.keys)
+        positions = positions[found]
+        positions = positions[self.keys[positions] == probes[found]]
+        if not len(positions):
+            return []
+        name_ids = np.unique(csr_gather(self.offsets, self.postings, positions))
+        return csr_gather(self.store.record_offsets, self.store.name_records, name_ids).tolist()
@@ -0,0 +1,150 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import numpy as np
+import pandas as pd
+from prettytable import PrettyTable
+from batch_scorer import BatchScorer
+from cascade_calibration import synthetic_pairs
+from enterprise_finder import my_ngram, skibidi_learn, the_fuzzz, the_lengther, set_bigram_jaccard
+
+
+def pair_scorer(function):
+    """Scores aligned pairs one by one with a scorer of enterprise_finder."""
+    def score(good, bad):
+        return np.array([function(g, b) for g, b in zip(good, bad)], dtype=np.float64)
+    return score
+
+def batch_scorer(good, bad):
+    """The batch engine, vectorization included."""
+    ids = np.arange(len(good))
+    return BatchScorer(good, bad).score_pairs(ids, ids)['moyenne']
+
+def cheap_scorer(good, bad):
+    """The set-bigram Jaccard of the batch engine, the first stage of the cascade."""
+    ids = np.arange(len(good))
+    return BatchScorer(good, bad).set_jaccard_pairs(ids, ids)
+
+# The name_finder scorers, in their enterprise_finder per-pair form, and the batch engine
+SCORERS = {
+    'brut_force': pair_scorer(set_bigram_jaccard),
+    'my_ngram': pair_scorer(my_ngram),
+    'skibidi_learn': pair_scorer(skibidi_learn),
+    'the_fuzzz': pair_scorer(the_fuzzz),
+    'the_lengther': pair_scorer(the_lengther),
+    'batch': batch_scorer,
+    'batch_cheap': cheap_scorer,
+}
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_scorer(scorer, good, bad, truth, repeat, threshold):
+    """
+    @brief Times `repeat` runs of a scorer over the pairs.
+
+    @return A dict with the run times, the pairs per second of the median run,
+            and the agreement of `score >= threshold` with the ground truth.
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        scores = scorer(good, bad)
+        seconds.append(time.perf_counter() - start)
+    found = scores >= threshold
+    median = statistics.median(seconds)
+    return {
+        'seconds': seconds,
+        'pairs_per_sec': len(good) / median if median else None,
+        'accuracy': float(np.mean(found == truth)),
+        'recall': float(found[truth].mean()) if truth.any() else None,
+    }
+
+def benchmark(names, sizes, scorers, repeat=3, seed=0, threshold=0.337, budget=60.0):
+    """
+    @brief Runs every scorer on seeded synthetic datasets of every size.
+
+    The datasets are prefixes of one synthetic_pairs draw of the largest size,
+    so a size always holds the same pairs for a given seed. A scorer skips the
+    sizes its last measured rate predicts to take more than `budget` seconds
+    for all the repetitions.
+
+    @return One result dict per (scorer, size).
+    """
+    good, bad, truth = synthetic_pairs(names, max(sizes), seed)
+    results = []
+    for name in scorers:
+        rate = None
+        for size in sorted(sizes):
+            result = {'scorer': name, 'pairs': size}
+            if rate is not None and size * repeat / rate > budget:
+                result['skipped'] = f"estimated over the {budget:g}s budget"
+            else:
+                result.update(run_scorer(SCORERS[name], good[:size], bad[:size], truth[:size], repeat, threshold))
+                rate = result['pairs_per_sec'] or rate
+            results.append(result)
+    return results
+
+def compare(results, previous):
+    """Ratio of the pairs per second of each (scorer, size) to a previous run, above 1 when faster."""
+    before = {(row['scorer'], row['pairs']): row.get('pairs_per_sec') for row in previous['results']}
+    return {(row['scorer'], row['pairs']): row['pairs_per_sec'] / before[(row['scorer'], row['pairs'])]
+            for row in results
+            if row.get('pairs_per_sec') and before.get((row['scorer'], row['pairs']))}
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproducible benchmark of the name scorers.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000],
+                        help="number of pairs of each dataset")
+    parser.add_argument("--scorers", nargs="+", choices=list(SCORERS), default=list(SCORERS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--threshold", type=float, default=0.337,
+                        help="score from which a pair is predicted a match, the probable category by default")
+    parser.add_argument("--budget", type=float, default=60.0,
+                        help="seconds a scorer may spend on the repetitions of one size")
+    parser.add_argument("--output", default="scoring_benchmark.json")
+    parser.add_argument("--compare", help="previous JSON output to compare the pairs per second with")
+    args = parser.parse_args()
+
+    names = pd.concat([pd.read_csv(path)['CT_Intitule'] for path in ('client_good_siret.csv', 'client_bad_siret.csv')])
+    names = sorted(set(names.dropna().astype(str)))
+    results = benchmark(names, args.sizes, args.scorers, args.repeat, args.seed, args.threshold, args.budget)
+    report = {
+        'commit': current_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'threshold': args.threshold,
+        'results': results,
+    }
+    with open(args.output, 'w') as json_file:
+        json.dump(report, json_file, indent=4)
+
+    ratios = {}
+    if args.compare:
+        with open(args.compare) as json_file:
+            ratios = compare(results, json.load(json_file))
+    table = PrettyTable()
+    table.field_names = ["Scorer", "Pairs", "Pairs/s", "Accuracy", "Recall", "vs previous"]
+    for row in results:
+        if 'skipped' in row:
+            table.add_row([row['scorer'], row['pairs'], "skipped", "-", "-", "-"])
+            continue
+        ratio = ratios.get((row['scorer'], row['pairs']))
+        table.add_row([row['scorer'], row['pairs'], f"{row['pairs_per_sec']:,.0f}", f"{row['accuracy']:.2%}",
+                       f"{row['recall']:.2%}" if row['recall'] is not None else "-",
+                       f"x{ratio:.2f}" if ratio else "-"])
+    print(table)
+
+if __name__ == "__main__":
+    main()
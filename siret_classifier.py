@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+
+
+SIRET_LENGTHS = (9, 14)
+# The establishments of La Poste share one SIREN and do not follow the Luhn key
+LA_POSTE_SIREN = '356000000'
+# Luhn doubling of a digit, minus 9 above 9
+DOUBLED_DIGIT = np.array([0, 2, 4, 6, 8, 1, 3, 5, 7, 9], dtype=np.uint8)
+
+
+def clean_sirets(sirets):
+    """
+    @brief Removes every space of the raw CT_Siret values, as REPLACE(CT_Siret, ' ', '') does in main.py.
+
+    @return A pandas Series of strings, NULL values stay missing.
+    """
+    sirets = pd.Series(sirets, dtype=object)
+    return sirets.where(sirets.isna(), sirets.astype(str).str.replace(' ', '', regex=False))
+
+def digit_matrix(clean, width=14):
+    """
+    @brief Lays the first `width` characters of every value out as a matrix of code points.
+
+    @param clean Cleaned SIRET values, missing values count as empty strings.
+
+    @return A tuple (codes, lengths): codes is a (n, width) uint32 array padded
+            with zeros, lengths the length of every value, capped at width + 1
+            so that longer values are still told apart.
+    """
+    text = pd.Series(clean, dtype=object).fillna('').to_numpy(dtype=f'U{width + 1}')
+    lengths = np.char.str_len(text)
+    codes = text.view(np.uint32).reshape(len(text), width + 1)[:, :width]
+    return codes, lengths
+
+def valid_format(codes, lengths):
+    """
+    @return A boolean array, True where the value is 9 or 14 ASCII digits.
+    """
+    in_value = np.arange(codes.shape[1])[None, :] < lengths[:, None]
+    digits = (codes >= ord('0')) & (codes <= ord('9'))
+    return np.isin(lengths, SIRET_LENGTHS) & np.all(digits | ~in_value, axis=1)
+
+def luhn_valid(codes, lengths):
+    """
+    @brief Checks the Luhn key of SIREN and SIRET laid out by digit_matrix, in one pass over the matrix.
+
+    Starting from the last digit, every second digit is doubled (minus 9
+    above 9) and the digit sum must be a multiple of 10. The SIRET of La
+    Poste establishments (SIREN 356000000) may instead have a plain digit
+    sum multiple of 5.
+
+    @param codes, lengths Values already known to be 9 or 14 digits.
+
+    @return A boolean array, True where the key is right.
+    """
+    digits = (codes - ord('0')).astype(np.uint8)
+    siren = np.array([ord(digit) for digit in LA_POSTE_SIREN], dtype=codes.dtype)
+    valid = np.zeros(len(lengths), dtype=bool)
+    for length in SIRET_LENGTHS:
+        rows = lengths == length
+        group = digits[rows, :length]
+        plain = group.sum(axis=1, dtype=np.int32)
+        # Counted from the last digit, the doubled ones sit on the columns of the length's parity
+        doubled = group[:, length % 2::2]
+        key = plain - doubled.sum(axis=1, dtype=np.int32) + DOUBLED_DIGIT[doubled].sum(axis=1, dtype=np.int32)
+        valid[rows] = key % 10 == 0
+        if length == 14:
+            la_poste = np.all(codes[rows, :len(LA_POSTE_SIREN)] == siren, axis=1)
+            valid[rows] |= la_poste & (plain % 5 == 0)
+    return valid
+
+def checksum_valid(clean):
+    """
+    @brief Checks the Luhn key of cleaned SIREN / SIRET values.
+
+    @return A boolean array, False where the value is not 9 or 14 digits or its key is wrong.
+    """
+    codes, lengths = digit_matrix(clean)
+    valid = valid_format(codes, lengths)
+    valid[valid] = luhn_valid(codes[valid], lengths[valid])
+    return valid
+
+
+class SiretClassifier:
+    """
+    @brief Vectorized version of the SIRET classification of the main.py queries and of V1's SiretProcessor.
+
+    Every label is computed for a whole column at once:
+
+    - empty : NULL, or nothing left once the spaces are removed
+    - bad   : anything else that is not 9 or 14 digits
+    - good  : first occurrence of a valid SIRET
+    - dup   : later occurrences of a valid SIRET
+
+    The SIRET already seen are kept between calls, so a table classified
+    chunk by chunk gets the same labels as in one call. They are kept in a
+    set updated in place: a chunk costs its own size, not the number of
+    SIRET seen so far.
+    """
+
+    def __init__(self):
+        self.seen = set()
+
+    def classify(self, sirets):
+        """
+        @param sirets The raw CT_Siret values.
+
+        @return A tuple (labels, clean) of pandas Series aligned on `sirets`:
+                the label of every value and its cleaned SIRET.
+        """
+        clean = clean_sirets(sirets)
+        codes, lengths = digit_matrix(clean)
+        valid = valid_format(codes, lengths)
+        labels = np.where(lengths == 0, 'empty', 'bad').astype(object)
+        valid_clean = clean[valid]
+        codes, uniques = pd.factorize(valid_clean)
+        # One set lookup per distinct SIRET of the chunk, isin would copy the whole set on every call
+        known = np.fromiter((siret in self.seen for siret in uniques), dtype=bool, count=len(uniques))
+        dup = valid_clean.duplicated(keep='first').to_numpy() | known[codes]
+        labels[valid] = np.where(dup, 'dup', 'good')
+        self.seen.update(uniques)
+        return pd.Series(labels, index=clean.index), clean
+
+
+def classify_sirets(sirets):
+    """
+    @brief Classifies a whole column of raw CT_Siret values in one pass.
+
+    @return A pandas Series of 'good', 'dup', 'bad' or 'empty' labels.
+    """
+    labels, _ = SiretClassifier().classify(sirets)
+    return labels
@@ -0,0 +1,101 @@
+import sqlite3
+import threading
+import pandas as pd
+
+
+NINE_DIGITS = "[0-9]" * 9
+FOURTEEN_DIGITS = "[0-9]" * 14
+
+
+class SnapshotStore:
+    """
+    @brief Local SQLite copy of the F_COMPTET rows of every database, for delta extractions.
+
+    Rows are keyed by (DB_Name, CT_Num) and carry the content hash computed by
+    the server, so a run only has to fetch the rows whose hash moved. The
+    good / dup / bad split is never stored: it depends on the other rows of
+    the database, so it is recomputed from the whole snapshot by classified(),
+    the same way the single-scan query of main.py does it on the server.
+    """
+
+    def __init__(self, path='siret_snapshot.sqlite'):
+        """
+        @param path The SQLite file, created on the first run.
+        """
+        # Extraction workers share the store, every access goes through the lock
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute("""CREATE TABLE IF NOT EXISTS comptet (
+                                    db_name TEXT NOT NULL,
+                                    ct_num TEXT NOT NULL,
+                                    ct_siret TEXT,
+                                    ct_intitule TEXT,
+                                    row_hash TEXT NOT NULL,
+                                    PRIMARY KEY (db_name, ct_num)
+                                )""")
+
+    def hashes(self, db_name):
+        """
+        @return A dict CT_Num -> content hash of the rows of db_name in the snapshot.
+        """
+        with self._lock:
+            cursor = self._db.execute("SELECT ct_num, row_hash FROM comptet WHERE db_name = ?", (db_name,))
+            return dict(cursor.fetchall())
+
+    def apply(self, db_name, rows, removed=()):
+        """
+        @brief Upserts new and changed rows of a database and deletes the removed ones, in one transaction.
+
+        @param rows A DataFrame with the CT_Num, CT_Siret, CT_Intitule and RowHash columns.
+        @param removed The CT_Num that are no longer in F_COMPTET.
+        """
+        records = [(db_name, num, siret, intitule, row_hash) for num, siret, intitule, row_hash
+                   in rows[['CT_Num', 'CT_Siret', 'CT_Intitule', 'RowHash']].itertuples(index=False)]
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO comptet VALUES (?, ?, ?, ?, ?)", records)
+            self._db.executemany("DELETE FROM comptet WHERE db_name = ? AND ct_num = ?",
+                                 [(db_name, num) for num in removed])
+
+    def classified(self, db_name):
+        """
+        @brief Classifies the snapshot rows of a database, with the columns of the single-scan query.
+
+        Among the rows sharing a valid SIRET the lowest CT_Num is the good one
+        and the others are duplicates, so adding or removing a row re-ranks
+        its whole SIRET group, and the outcome does not depend on scan order.
+
+        @return A DataFrame with the Category, CleanSIRET, OriginalSIRET, CT_Num,
+                CT_Intitule and DB_Name columns, ready for split_categories.
+        """
+        query = f"""WITH CleanedSIRET AS (
+                        SELECT REPLACE(ct_siret, ' ', '') AS CleanSIRET,
+                            ct_siret AS OriginalSIRET,
+                            ct_num AS CT_Num,
+                            ct_intitule AS CT_Intitule,
+                            db_name AS DB_Name
+                        FROM comptet
+                        WHERE db_name = ?
+                    ), Numbered AS (
+                        SELECT *, ROW_NUMBER() OVER (PARTITION BY CleanSIRET ORDER BY CT_Num) AS RowNum
+                        FROM CleanedSIRET
+                    )
+                    SELECT CASE
+                            WHEN CleanSIRET IS NULL THEN NULL
+                            WHEN CleanSIRET GLOB '{NINE_DIGITS}' OR CleanSIRET GLOB '{FOURTEEN_DIGITS}'
+                                THEN CASE WHEN RowNum = 1 THEN 'good' ELSE 'dup' END
+                            ELSE 'bad'
+                        END AS Category,
+                        CleanSIRET,
+                        OriginalSIRET,
+                        CT_Num,
+                        CT_Intitule,
+                        DB_Name
+                    FROM Numbered
+                    ORDER BY CT_Num"""
+        with self._lock:
+            return pd.read_sql(query, self._db, params=(db_name,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,262 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from siret_classifier import DOUBLED_DIGIT
+
+
+LEGAL_FORMS = np.array(['SARL', 'SAS', 'SASU', 'EURL', 'SA', 'SCI', 'SNC', 'EI', 'SCOP', 'SELARL'], dtype=object)
+ACTIVITIES = np.array([
+    'BÂTIMENT', 'ÉLECTRICITÉ', 'MENUISERIE', 'TRANSPORTS', 'BOULANGERIE', 'CAFÉ', 'GARAGE', 'PLOMBERIE',
+    'CHAUFFAGE', 'PEINTURE', 'MAÇONNERIE', 'CHARPENTE', 'COUVERTURE', 'TERRASSEMENT', 'NÉGOCE', 'LOCATION',
+    'ÉQUIPEMENTS', 'MATÉRIAUX', 'BÉTON', 'PRÉFABRICATION', 'AGRÉGATS', 'CARRIÈRES', 'FORMATION', 'SÉCURITÉ',
+    'NETTOYAGE', 'RESTAURATION', 'HÔTEL', 'PHARMACIE', 'IMMOBILIÈRE', 'CONSTRUCTION', 'ÉNERGIES', 'SERVICES',
+    'INDUSTRIES', 'DISTRIBUTION', 'AMÉNAGEMENT', 'PAYSAGE', 'MÉTALLERIE', 'SERRURERIE', 'VITRERIE', 'ISOLATION',
+], dtype=object)
+FAMILY_NAMES = np.array([
+    'MARTIN', 'BERNARD', 'DUBOIS', 'THOMAS', 'ROBERT', 'RICHARD', 'PETIT', 'DURAND', 'LEROY', 'MOREAU',
+    'SIMON', 'LAURENT', 'LEFÈVRE', 'MICHEL', 'GARCIA', 'DAVID', 'BERTRAND', 'ROUX', 'VINCENT', 'FOURNIER',
+    'MOREL', 'GIRARD', 'ANDRÉ', 'LEFÈBVRE', 'MERCIER', 'DUPONT', 'LAMBERT', 'BONNET', 'FRANÇOIS', 'MARTINEZ',
+    'LEGRAND', 'GARNIER', 'FAURE', 'ROUSSEAU', 'BLANC', 'GUÉRIN', 'MÜLLER', 'HENRY', 'ROUSSEL', 'NICOLAS',
+    'PERRIN', 'MORIN', 'MATHIEU', 'CLÉMENT', 'GAUTHIER', 'DUMONT', 'LOPEZ', 'FONTAINE', 'CHEVALIER', 'ROBIN',
+], dtype=object)
+PLACES = np.array([
+    'DE LA RÉUNION', 'DU SUD', 'DE L\'OUEST', 'DE SAINT-DENIS', 'DE SAINT-PIERRE', 'DU PORT', 'DES ÎLES',
+    'DE L\'EST', 'DU NORD', 'OCÉAN INDIEN',
+], dtype=object)
+# name_finder's phonetic misspellings, on the uppercase letters of company names
+MISSPELLINGS = {
+    'A': 'EIO', 'E': 'AIY', 'I': 'EYA', 'O': 'AUE', 'U': 'OYA', 'C': 'KS', 'S': 'ZC',
+    'Y': 'IE', 'L': 'RU', 'R': 'LW', 'N': 'M', 'T': 'DC',
+}
+ALPHABET = np.array([ord(char) for char in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'], dtype=np.uint32)
+# Shapes of the invalid SIRET of the bad file, most of them empty as in the bundled CSV files
+INVALID_SHAPES = np.array(['empty', 'short', 'letters', 'spaced'], dtype=object)
+INVALID_WEIGHTS = [0.9, 0.04, 0.03, 0.03]
+COLUMNS = ['CT_Siret', 'CT_Num', 'CT_Intitule', 'DB_NAME']
+
+
+def _substitution_table():
+    size = max(map(ord, MISSPELLINGS)) + 1
+    width = max(len(choices) for choices in MISSPELLINGS.values())
+    table = np.zeros((size, width), dtype=np.uint32)
+    counts = np.zeros(size, dtype=np.int64)
+    for char, choices in MISSPELLINGS.items():
+        table[ord(char), :len(choices)] = [ord(choice) for choice in choices]
+        counts[ord(char)] = len(choices)
+    return table, counts
+
+SUBSTITUTIONS, SUBSTITUTION_COUNTS = _substitution_table()
+
+
+def to_matrix(names):
+    """Code points of the names, as a (n, width) uint32 matrix padded with zeros, and their lengths."""
+    text = np.asarray(names, dtype=str)
+    width = max(text.dtype.itemsize // 4, 1)
+    return text.astype(f'U{width}').view(np.uint32).reshape(len(text), width), np.char.str_len(text)
+
+def from_matrix(codes):
+    """Names back from a code point matrix, trailing zeros dropped."""
+    codes = np.ascontiguousarray(codes, dtype=np.uint32)
+    return codes.view(f'U{codes.shape[1]}').ravel().astype(object)
+
+def misspell(names, rng, rate=0.3):
+    """
+    @brief Vectorized name_finder misspelling: phonetic_misspell then length_misspell, on a whole batch.
+
+    Every letter with a phonetic substitute is replaced with probability
+    `rate`, then one character is deleted or one letter inserted at a random
+    position of every name, both on a code point matrix.
+
+    @return An object array of misspelled names.
+    """
+    codes, lengths = to_matrix(names)
+    n, width = codes.shape
+
+    mutable = np.zeros(codes.shape, dtype=bool)
+    inside = codes < len(SUBSTITUTION_COUNTS)
+    mutable[inside] = SUBSTITUTION_COUNTS[codes[inside]] > 0
+    mutate = mutable & (rng.random(codes.shape) < rate)
+    choices = (rng.random(mutate.sum()) * SUBSTITUTION_COUNTS[codes[mutate]]).astype(np.int64)
+    codes[mutate] = SUBSTITUTIONS[codes[mutate], choices]
+
+    # Shorten names of two characters or more, lengthen the others, as length_misspell
+    shorten = (rng.random(n) < 0.5) & (lengths > 1)
+    at = (rng.random(n) * (lengths + ~shorten)).astype(np.int64)
+    padded = np.concatenate([codes, np.zeros((n, 1), dtype=np.uint32)], axis=1)
+    positions = np.arange(width + 1)[None, :]
+    source = np.where(shorten[:, None],
+                      positions + (positions >= at[:, None]),
+                      positions - (positions > at[:, None]))
+    source = np.minimum(source, width)
+    out = np.take_along_axis(padded, source, axis=1)
+    inserted = ~shorten[:, None] & (positions == at[:, None])
+    out[inserted] = ALPHABET[rng.integers(0, len(ALPHABET), inserted.sum())]
+    return from_matrix(out)
+
+def company_names(count, rng):
+    """
+    @brief Draws company names: one or two activity or family words, an optional place, a legal form before or after.
+
+    @return An object array of names.
+    """
+    first = np.where(rng.random(count) < 0.5,
+                     ACTIVITIES[rng.integers(0, len(ACTIVITIES), count)],
+                     FAMILY_NAMES[rng.integers(0, len(FAMILY_NAMES), count)])
+    second = np.where(rng.random(count) < 0.6, ' ' + FAMILY_NAMES[rng.integers(0, len(FAMILY_NAMES), count)], '')
+    place = np.where(rng.random(count) < 0.2, ' ' + PLACES[rng.integers(0, len(PLACES), count)], '')
+    form = LEGAL_FORMS[rng.integers(0, len(LEGAL_FORMS), count)]
+    position = rng.random(count)
+    body = first + second + place
+    return np.where(position < 0.4, form + ' ' + body, np.where(position < 0.8, body + ' ' + form, body))
+
+def luhn_digit(digits):
+    """
+    @brief The digit completing every row of a digit matrix into a valid Luhn number.
+
+    @param digits A (n, length) uint8 matrix, the number without its key.
+    """
+    length = digits.shape[1]
+    # The key is not doubled, so the doubled digits are the ones at an odd distance from it
+    doubled = (length - 1 - np.arange(length)) % 2 == 0
+    total = digits[:, ~doubled].sum(axis=1, dtype=np.int64) + DOUBLED_DIGIT[digits[:, doubled]].sum(axis=1, dtype=np.int64)
+    return ((10 - total % 10) % 10).astype(np.uint8)
+
+def digits_to_str(digits):
+    return from_matrix(digits.astype(np.uint32) + ord('0'))
+
+def digits_of(values, width):
+    """The `width` last decimal digits of every value, as a (n, width) uint8 matrix."""
+    return ((values[:, None] // 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)) % 10).astype(np.uint8)
+
+def valid_sirets(first_index, count, rng, multiplier, offset, siren_rate=0.1):
+    """
+    @brief Unique SIRET (or SIREN for `siren_rate` of them) with right Luhn keys.
+
+    The 8 first SIREN digits are an affine bijection of the row index modulo
+    1e8, so up to 1e8 good rows never share a SIREN.
+    """
+    base = (multiplier * (first_index + np.arange(count, dtype=np.int64)) + offset) % 10 ** 8
+    siren = digits_of(base, 8)
+    siren = np.concatenate([siren, luhn_digit(siren)[:, None]], axis=1)
+    nic = rng.integers(0, 10, (count, 4), dtype=np.uint8)
+    siret = np.concatenate([siren, nic], axis=1)
+    siret = np.concatenate([siret, luhn_digit(siret)[:, None]], axis=1)
+    return np.where(rng.random(count) < siren_rate, digits_to_str(siren), digits_to_str(siret))
+
+def invalid_sirets(count, rng):
+    """Invalid CT_Siret values: mostly empty, some too short, with letters or with a digit missing behind spaces."""
+    shapes = rng.choice(INVALID_SHAPES, count, p=INVALID_WEIGHTS)
+    digits = rng.integers(0, 10, (count, 14), dtype=np.uint8).astype(np.uint32) + ord('0')
+    letters = ALPHABET[rng.integers(0, len(ALPHABET), (count, 3))]
+    space = np.full((count, 1), ord(' '), dtype=np.uint32)
+    spaced = np.concatenate([digits[:, :3], space, digits[:, 3:6], space, digits[:, 6:9], space, digits[:, 9:13]], axis=1)
+    values = np.full(count, '', dtype=object)
+    values = np.where(shapes == 'short', from_matrix(digits[:, :7]), values)
+    values = np.where(shapes == 'letters', from_matrix(np.concatenate([digits[:, :11], letters], axis=1)), values)
+    return np.where(shapes == 'spaced', from_matrix(spaced), values)
+
+def numbers(prefix, first_index, count):
+    """CT_Num values, the prefix then the zero-padded row index."""
+    return prefix + digits_to_str(digits_of(first_index + np.arange(count, dtype=np.int64), 9))
+
+def generate(output_dir, rows, seed=0, dup_rate=0.05, invalid_rate=0.5, match_rate=0.7,
+             databases=('SYNTH1', 'SYNTH2', 'SYNTH3'), chunk_size=100000):
+    """
+    @brief Streams seeded synthetic client files to disk, chunk by chunk.
+
+    Writes client_good_siret.csv, client_dup_siret.csv and client_bad_siret.csv
+    shaped as main.py does, and synthetic_truth.csv mapping the CT_Num of every
+    bad row made from a good one to that good CT_Num.
+
+    @param rows Total number of rows of the three client files.
+    @param dup_rate Share of the rows with a valid SIRET that repeat one of a good row.
+    @param invalid_rate Share of the rows with an invalid SIRET, written to the bad file.
+    @param match_rate Share of the bad rows whose name is a misspelling of a good row of the same chunk.
+
+    @return The number of rows written per file.
+    """
+    rng = np.random.default_rng(seed)
+    # Odd and not a multiple of 5, so coprime with 1e8
+    multiplier = int(rng.integers(10 ** 6, 10 ** 7)) * 10 + 1
+    offset = int(rng.integers(0, 10 ** 8))
+    databases = np.array(databases, dtype=object)
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {name: os.path.join(output_dir, f'client_{name}_siret.csv') for name in ('good', 'dup', 'bad')}
+    paths['truth'] = os.path.join(output_dir, 'synthetic_truth.csv')
+    written = {name: 0 for name in paths}
+    for path in paths.values():
+        if os.path.exists(path):
+            os.remove(path)
+
+    def write(name, frame):
+        frame.to_csv(paths[name], mode='a', index=False, header=not written[name])
+        written[name] += len(frame)
+
+    for start in range(0, rows, chunk_size):
+        count = min(chunk_size, rows - start)
+        bad_count = int(round(count * invalid_rate))
+        dup_count = int(round((count - bad_count) * dup_rate))
+        good_count = count - bad_count - dup_count
+        if good_count == 0:
+            dup_count, bad_count = 0, count - good_count
+
+        good_names = company_names(good_count, rng)
+        good = pd.DataFrame({
+            'CT_Siret': valid_sirets(written['good'], good_count, rng, multiplier, offset),
+            'CT_Num': numbers('G', written['good'], good_count),
+            'CT_Intitule': good_names,
+            'DB_NAME': databases[rng.integers(0, len(databases), good_count)],
+        }, columns=COLUMNS)
+
+        copies = rng.integers(0, good_count, dup_count) if good_count else np.zeros(0, dtype=np.int64)
+        dup = pd.DataFrame({
+            'CT_Siret': good['CT_Siret'].to_numpy()[copies],
+            'CT_Num': numbers('D', written['dup'], dup_count),
+            'CT_Intitule': good_names[copies],
+            'DB_NAME': databases[rng.integers(0, len(databases), dup_count)],
+        }, columns=COLUMNS)
+
+        matched = (rng.random(bad_count) < match_rate) & (good_count > 0)
+        sources = rng.integers(0, max(good_count, 1), bad_count)
+        bad_names = company_names(bad_count, rng)
+        if matched.any():
+            bad_names[matched] = misspell(good_names[sources[matched]], rng)
+        bad = pd.DataFrame({
+            'CT_Siret': invalid_sirets(bad_count, rng),
+            'CT_Num': numbers('B', written['bad'], bad_count),
+            'CT_Intitule': bad_names,
+            'DB_NAME': databases[rng.integers(0, len(databases), bad_count)],
+        }, columns=COLUMNS)
+        truth = pd.DataFrame({
+            'CT_Num_Bad': bad['CT_Num'].to_numpy()[matched],
+            'CT_Num_Good': good['CT_Num'].to_numpy()[sources[matched]],
+        })
+
+        write('good', good)
+        write('dup', dup)
+        write('bad', bad)
+        write('truth', truth)
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Seeded synthetic client files for load tests of main.py and enterprise_finder.")
+    parser.add_argument("--rows", type=int, default=1000000, help="rows of the three client files together")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dup-rate", type=float, default=0.05,
+                        help="share of the valid-SIRET rows repeating the SIRET of a good row")
+    parser.add_argument("--invalid-rate", type=float, default=0.5, help="share of the rows with an invalid SIRET")
+    parser.add_argument("--match-rate", type=float, default=0.7,
+                        help="share of the bad rows named after a misspelled good row")
+    parser.add_argument("--databases", nargs="+", default=['SYNTH1', 'SYNTH2', 'SYNTH3'])
+    parser.add_argument("--chunk-size", type=int, default=100000, help="rows generated and written at once")
+    parser.add_argument("--output-dir", default=".")
+    args = parser.parse_args()
+
+    written = generate(args.output_dir, args.rows, args.seed, args.dup_rate, args.invalid_rate, args.match_rate,
+                       args.databases, args.chunk_size)
+    for name, count in written.items():
+        print(f"{name}: {count} rows")
+
+if __name__ == "__main__":
+    main()
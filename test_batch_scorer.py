@@ -0,0 +1,64 @@
+import os
+from collections import Counter
+import numpy as np
+import pandas as pd
+import pytest
+from batch_scorer import BatchScorer, TOLERANCE, compare_with_reference
+from enterprise_finder import my_ngram, skibidi_learn, the_fuzzz, the_lengther
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REFERENCE = {'ngram': my_ngram, 'skibidi': skibidi_learn, 'fuzz': the_fuzzz, 'lengther': the_lengther}
+
+
+@pytest.fixture(scope="module")
+def names():
+    good = pd.read_csv(os.path.join(HERE, 'client_good_siret.csv'))['CT_Intitule'].astype(str).tolist()
+    bad = pd.read_csv(os.path.join(HERE, 'client_bad_siret.csv'))['CT_Intitule'].astype(str).tolist()
+    return good, bad
+
+def sample_pairs(good, bad, count, seed):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, len(good), count), rng.integers(0, len(bad), count)
+
+def test_score_pairs_matches_reference(names):
+    good, bad = names
+    good_ids, bad_ids = sample_pairs(good, bad, 500, 0)
+    scores = BatchScorer(good, bad).score_pairs(good_ids, bad_ids)
+    for key, scorer in REFERENCE.items():
+        expected = np.array([scorer(good[g], bad[b]) for g, b in zip(good_ids, bad_ids)])
+        np.testing.assert_allclose(scores[key], expected, rtol=0, atol=TOLERANCE, err_msg=key)
+    expected = sum(scores[key] for key in REFERENCE) / 4
+    np.testing.assert_allclose(scores['moyenne'], expected, rtol=0, atol=TOLERANCE)
+
+def test_score_block_matches_reference(names):
+    good, bad = names
+    good_ids, bad_ids = sample_pairs(good, bad, 20, 1)
+    block = BatchScorer(good, bad).score_block(good_ids, bad_ids)
+    for key, scorer in REFERENCE.items():
+        expected = np.array([[scorer(good[g], bad[b]) for b in bad_ids] for g in good_ids])
+        np.testing.assert_allclose(block[key], expected, rtol=0, atol=TOLERANCE, err_msg=key)
+
+def test_compare_with_reference_within_tolerance(names):
+    good, bad = names
+    gaps = compare_with_reference(good, bad, sample=300)
+    assert max(gaps.values()) <= TOLERANCE, gaps
+
+def test_empty_vocabulary():
+    # No bigram at all: skibidi_learn raises on an empty vocabulary, the batch engine scores 0.
+    good, bad = ['A', '', 'AB'], ['B', 'A', '']
+    scores = BatchScorer(good, bad).score_pairs([0, 1, 2], [0, 1, 2])
+    assert scores['skibidi'].tolist() == [0.0, 0.0, 0.0]
+    with pytest.raises(ValueError):
+        skibidi_learn('A', 'B')
+    for key in ('ngram', 'fuzz', 'lengther'):
+        expected = [REFERENCE[key](g, b) for g, b in zip(good, bad)]
+        np.testing.assert_allclose(scores[key], expected, rtol=0, atol=TOLERANCE, err_msg=key)
+
+def test_score_pairs_times_every_scorer(names):
+    good, bad = names
+    good_ids, bad_ids = sample_pairs(good, bad, 50, 2)
+    counts = Counter()
+    BatchScorer(good, bad).score_pairs(good_ids, bad_ids, counts)
+    for key in REFERENCE:
+        assert counts[f'calls:batch_{key}'] == 50
+        assert counts[f'seconds:batch_{key}'] > 0
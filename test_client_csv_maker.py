@@ -0,0 +1,56 @@
+import os
+import sys
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# The V1 modules import each other by bare name; appended so main.py here still wins over V1's
+sys.path.append(os.path.join(HERE, 'V1'))
+from client_csv_maker import csv_writer
+
+COLUMNS = ['CT_Siret', 'CT_Num', 'CT_Intitule', 'DB_Name']
+
+
+def database(db_name, rows):
+    return pd.DataFrame([(siret, num, name, db_name) for siret, num, name in rows], columns=COLUMNS)
+
+def read(category):
+    return pd.read_csv(csv_writer.files[category], dtype=str, keep_default_na=False)
+
+def write_database(csv, db, good, duplicate, bad):
+    csv.write_sirets('good', db, good)
+    csv.write_sirets('duplicate', db, duplicate)
+    csv.write_sirets('bad', db, bad)
+
+def test_two_databases(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    a = database('A', [('73282932000074', 'C1', 'APPLE'), ('', 'C2', 'EMPTY'), (None, 'C3', 'NULL')])
+    b = database('B', [('73282932000074', 'D1', 'APPLE'), ('', 'D2', 'EMPTY'), (None, 'D3', 'NULL'),
+                       ('XX', 'D4', 'BAD'), ('552100554', 'D5', 'RENAULT'), ('552100554', 'D6', 'RENAULT BIS')])
+    with csv_writer() as csv:
+        write_database(csv, a, ['73282932000074'], [], ['', None])
+        write_database(csv, b, ['552100554'], ['73282932000074', '552100554'], ['', None, 'XX'])
+    # Every bad row of both databases, the empty and NULL SIRET included
+    assert read('bad')[['DB_Name', 'CT_Num']].values.tolist() == [
+        ['A', 'C2'], ['A', 'C3'], ['B', 'D2'], ['B', 'D3'], ['B', 'D4']]
+    # A SIRET number is written once per file, whatever the database
+    assert read('good')['CT_Num'].tolist() == ['C1', 'D5', 'D6']
+    assert read('duplicate')['CT_Num'].tolist() == ['D1', 'D5', 'D6']
+
+def test_resume_skips_written_rows(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    a = database('A', [('73282932000074', 'C1', 'APPLE'), ('', 'C2', 'EMPTY'), ('123', 'C3', 'SHORT')])
+    with csv_writer() as csv:
+        write_database(csv, a, ['73282932000074'], [], ['', '123'])
+    b = database('B', [('', 'D1', 'EMPTY')])
+    with csv_writer(resume=True) as csv:
+        write_database(csv, a, ['73282932000074'], [], ['', '123'])
+        write_database(csv, b, [], [], [''])
+    assert read('good')['CT_Num'].tolist() == ['C1']
+    assert read('bad')['CT_Num'].tolist() == ['C2', 'C3', 'D1']
+
+def test_malformed_siret_is_not_deduplicated(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rows = database('A', [('', 'C1', 'EMPTY'), ('', 'C2', 'EMPTY')])
+    with csv_writer() as csv:
+        assert csv.write_rows('duplicate', rows.iloc[:1]) == 1
+        assert csv.write_rows('duplicate', rows.iloc[1:]) == 1
@@ -0,0 +1,40 @@
+import os
+import pandas as pd
+import pytest
+import enterprise_finder
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ARGS = ['--executor', 'thread', '--workers', '1', '--shard-size', '16', '--log-every', '0']
+
+
+@pytest.fixture
+def clients(tmp_path, monkeypatch):
+    """The first rows of the bundled client files, in a working directory of their own."""
+    monkeypatch.chdir(tmp_path)
+    good = pd.read_csv(os.path.join(HERE, 'client_good_siret.csv'), dtype=str).head(60)
+    bad = pd.read_csv(os.path.join(HERE, 'client_bad_siret.csv'), dtype=str).head(40)
+    good.to_csv('client_good_siret.csv', index=False)
+    bad.to_csv('client_bad_siret.csv', index=False)
+    return good, bad
+
+def rows(category):
+    with open(f'{category}.csv') as csv_file:
+        return sorted(csv_file.readlines())
+
+def test_resume_of_a_finished_run_keeps_the_outputs(clients):
+    enterprise_finder.main(ARGS)
+    outputs = {category: rows(category) for category in ('valid', 'probable', 'no_chance', 'exact')}
+    enterprise_finder.main(ARGS + ['--resume'])
+    assert {category: rows(category) for category in outputs} == outputs
+
+@pytest.mark.parametrize("side, column", [('good', 'CT_Siret'), ('bad', 'CT_Intitule')])
+def test_resume_refuses_changed_inputs_of_the_same_size(clients, capsys, side, column):
+    enterprise_finder.main(ARGS)
+    good, bad = clients
+    frame = good if side == 'good' else bad
+    frame.loc[0, column] = '12345678901234' if column == 'CT_Siret' else 'RENAMED'
+    frame.to_csv(f'client_{side}_siret.csv', index=False)
+    with pytest.raises(SystemExit) as exit_info:
+        enterprise_finder.main(ARGS + ['--resume'])
+    assert exit_info.value.code == 84
+    assert "changed since the checkpoint" in capsys.readouterr().out
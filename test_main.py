@@ -0,0 +1,183 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import pytest
+import main
+
+# pd.read_sql warns on any DB-API connection other than sqlite3's, pyodbc's included
+pytestmark = pytest.mark.filterwarnings("ignore:pandas only supports SQLAlchemy")
+
+USE = re.compile(r"\s*USE \[(.+)\];?\s*$")
+DATABASES = {
+    'A': [('73282932000074', 'C1', 'APPLE'), ('732 829 320 00074', 'C2', 'APPLE BIS'),
+          ('12345678901234', 'C3', 'LUHN'), ('ABC', 'C4', 'BAD'), (None, 'C5', 'NULL')],
+    'B': [('55210055400013', 'D1', 'RENAULT'), ('552100554', 'D2', 'RENAULT SIEGE')],
+    'SLOW': [('44306184100047', 'E1', 'GOOGLE'), ('', 'E2', 'EMPTY')],
+    'BROKEN': [('44306184100047', 'F1', 'GOOGLE')],
+}
+# The RowHash column on SQLite: ISNULL is a keyword there, so main.ROW_HASH cannot run as is
+ROW_HASH = "ROW_HASH(CT_Siret, CT_Intitule) AS RowHash"
+
+
+def row_hash(siret, intitule):
+    return hashlib.sha1(f"{chr(30) if siret is None else siret}{chr(31)}{intitule}".encode('utf-8')).hexdigest()
+
+
+class FakeServer:
+    """SQL Server stand-in holding the F_COMPTET rows of every database, with the connections opened on it."""
+
+    def __init__(self, databases=DATABASES, delays=None, broken=()):
+        """
+        @param databases The (CT_Siret, CT_Num, CT_Intitule) rows of every database, by database.
+        @param delays Seconds every query on a database takes, by database.
+        @param broken Databases whose queries fail and drop the connection.
+        """
+        self.databases = databases
+        self.delays = delays or {}
+        self.broken = set(broken)
+        self.queries = []
+        self.connections = []
+        self._lock = threading.Lock()
+
+    def connect(self, db_name=None):
+        connection = FakeConnection(self)
+        with self._lock:
+            self.connections.append(connection)
+        return connection
+
+
+class FakeConnection:
+    """
+    @brief DB-API connection of a FakeServer, on an in-memory SQLite database.
+
+    `USE [db]` loads the F_COMPTET rows of db and DB_NAME() returns its name,
+    so the plain scan of the local query mode runs unchanged, and the delta
+    mode with ROW_HASH. A query on a broken database fails and every later
+    query of the connection too.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.database = None
+        self.lost = False
+        self.closed = False
+        self.sqlite = sqlite3.connect(':memory:', check_same_thread=False)
+        self.sqlite.create_function('DB_NAME', 0, lambda: self.database)
+        self.sqlite.create_function('ROW_HASH', 2, row_hash)
+        self.sqlite.execute("CREATE TABLE F_COMPTET (CT_Siret TEXT, CT_Num TEXT, CT_Intitule TEXT)")
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+        self.sqlite.close()
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection.sqlite.cursor()
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, query, *params):
+        connection = self.connection
+        if connection.lost:
+            raise sqlite3.OperationalError("communication link failure")
+        use = USE.match(query)
+        if use:
+            connection.database = use.group(1)
+            connection.sqlite.execute("DELETE FROM F_COMPTET")
+            connection.sqlite.executemany("INSERT INTO F_COMPTET VALUES (?, ?, ?)",
+                                          connection.server.databases[connection.database])
+            return self
+        connection.server.queries.append((connection.database, query, list(*params)))
+        time.sleep(connection.server.delays.get(connection.database, 0))
+        if connection.database in connection.server.broken:
+            connection.lost = True
+            raise sqlite3.OperationalError("communication link failure")
+        self._cursor.execute(query, *params)
+        return self
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size):
+        return self._cursor.fetchmany(size)
+
+    def close(self):
+        self._cursor.close()
+
+
+def run_main(tmp_path, monkeypatch, server, databases, argv):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("DB_NAMES", ",".join(databases))
+    main.main(argv, connect=server.connect, row_hash=ROW_HASH)
+    with open(tmp_path / "stats.json") as json_file:
+        return json.load(json_file)
+
+def test_parallel_extraction_times_each_database(tmp_path, monkeypatch):
+    server = FakeServer(delays={'SLOW': 0.3})
+    stats = run_main(tmp_path, monkeypatch, server, ['A', 'SLOW', 'B'],
+                     ['--parallel', '2', '--query-mode', 'local', '--chunksize', '2'])
+    assert [entry['db_name'] for entry in stats] == ['A', 'SLOW', 'B']
+    counts = [{key: entry[key] for key in ('good', 'duplicate', 'bad', 'checksum_fail', 'total')} for entry in stats]
+    assert counts == [
+        {'good': 1, 'duplicate': 1, 'bad': 1, 'checksum_fail': 1, 'total': 4},
+        {'good': 1, 'duplicate': 0, 'bad': 1, 'checksum_fail': 0, 'total': 2},
+        {'good': 2, 'duplicate': 0, 'bad': 0, 'checksum_fail': 0, 'total': 2},
+    ]
+    seconds = {entry['db_name']: entry['seconds'] for entry in stats}
+    # Every database is timed on its own, not from the start of the run
+    assert seconds['SLOW'] >= 0.3
+    assert seconds['A'] < 0.3 and seconds['B'] < 0.3
+    # One connection per worker, switched between databases, closed at the end
+    assert 1 <= len(server.connections) <= 2
+    assert all(connection.closed for connection in server.connections)
+    with open(tmp_path / "client_good_siret.csv") as good_file:
+        assert len(good_file.readlines()) == 1 + 4
+
+def test_failed_query_discards_the_connection(tmp_path, monkeypatch):
+    server = FakeServer(broken={'BROKEN'})
+    stats = run_main(tmp_path, monkeypatch, server, ['BROKEN', 'A'], ['--parallel', '1', '--query-mode', 'local'])
+    assert stats[0]['db_name'] == 'BROKEN' and stats[0]['error'] == "extraction failed"
+    assert stats[1]['db_name'] == 'A' and stats[1]['total'] == 4
+    # The worker's broken connection was closed and replaced by a new one for A
+    assert len(server.connections) == 2
+    assert all(connection.closed for connection in server.connections)
+
+def read_nums(category):
+    with open(f"client_{category}_siret.csv") as csv_file:
+        return sorted(line.split(',')[-3] for line in csv_file.readlines()[1:])
+
+def test_delta_keeps_duplicates_right_across_runs(tmp_path, monkeypatch):
+    first = [('73282932000074', 'C1', 'APPLE'), ('732 829 320 00074', 'C2', 'APPLE BIS'),
+             ('ABC', 'C3', 'BAD'), ('55210055400013', 'C4', 'RENAULT'), ('552100554', 'C6', 'RENAULT SIEGE')]
+    server = FakeServer({'A': first, 'B': DATABASES['B']})
+    stats = run_main(tmp_path, monkeypatch, server, ['A', 'B'], ['--delta'])
+    assert [(entry['new'], entry['changed'], entry['removed']) for entry in stats] == [(5, 0, 0), (2, 0, 0)]
+    assert (stats[0]['good'], stats[0]['duplicate'], stats[0]['bad']) == (3, 1, 1)
+    assert read_nums('good') == ['C1', 'C4', 'C6', 'D1', 'D2'] and read_nums('dup') == ['C2']
+
+    # C1 removed: its duplicate C2 is promoted. C3 fixed to a SIRET already held by C6, C5 added as a duplicate of C4.
+    server.databases = {'A': [('732 829 320 00074', 'C2', 'APPLE BIS'), ('552100554', 'C3', 'BAD'),
+                              ('55210055400013', 'C4', 'RENAULT'), ('55210055400013', 'C5', 'RENAULT BIS'),
+                              ('552100554', 'C6', 'RENAULT SIEGE')],
+                        'B': DATABASES['B']}
+    server.queries.clear()
+    stats = run_main(tmp_path, monkeypatch, server, ['A', 'B'], ['--delta'])
+    assert [(entry['new'], entry['changed'], entry['removed']) for entry in stats] == [(1, 1, 1), (0, 0, 0)]
+    assert (stats[0]['good'], stats[0]['duplicate'], stats[0]['bad'], stats[0]['total']) == (3, 2, 0, 5)
+    assert read_nums('good') == ['C2', 'C3', 'C4', 'D1', 'D2']
+    assert read_nums('dup') == ['C5', 'C6']
+    # Only the new and changed rows were fetched in full
+    assert [params for database, _, params in server.queries if params] == [['C3', 'C5']]
@@ -0,0 +1,78 @@
+import pytest
+import memory_governor
+from memory_governor import MemoryGovernor
+
+MB = 2 ** 20
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class Sink:
+    def __init__(self):
+        self.flushes = 0
+        self.waiting = 0
+
+    def flush(self):
+        self.flushes += 1
+        self.waiting = 0
+
+    def backlog(self):
+        return self.waiting
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(memory_governor, 'time', clock)
+    return clock
+
+def run(governor, clock, monkeypatch, rss, seconds, sink=None, waiting=0):
+    """Calls check() every half second for `seconds` seconds, with the given RSS, in MB."""
+    monkeypatch.setattr(memory_governor, 'process_rss', lambda: rss * MB)
+    for _ in range(int(seconds * 2)):
+        clock.now += 0.5
+        if sink is not None:
+            sink.waiting += waiting
+        governor.check()
+
+def test_shrinks_once_per_cooldown_then_warns_once(clock, monkeypatch, capsys):
+    sink = Sink()
+    governor = MemoryGovernor(100 * MB, 8, sink=sink, cooldown=5.0)
+    run(governor, clock, monkeypatch, 150, 3, sink)
+    assert governor() == 4
+    run(governor, clock, monkeypatch, 150, 60, sink)
+    assert governor() == 1
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 4
+    assert [line.split('in-flight limit ')[1].split(',')[0] for line in lines[:3]] == ['8 -> 4', '4 -> 2', '2 -> 1']
+    assert 'WARNING' in lines[3]
+    # Nothing was waiting in the sink once at limit 1
+    assert sink.flushes == 3
+
+def test_flushes_at_the_floor_only_with_a_backlog(clock, monkeypatch, capsys):
+    sink = Sink()
+    governor = MemoryGovernor(100 * MB, 1, sink=sink)
+    run(governor, clock, monkeypatch, 150, 10, sink)
+    assert sink.flushes == 0
+    run(governor, clock, monkeypatch, 150, 2, sink, waiting=1)
+    assert sink.flushes == 4
+    assert len(capsys.readouterr().out.splitlines()) == 1
+
+def test_grows_back_under_low_water_once_per_cooldown(clock, monkeypatch):
+    governor = MemoryGovernor(100 * MB, 8, cooldown=5.0)
+    run(governor, clock, monkeypatch, 150, 1)
+    assert governor() == 4
+    # Between low water and the budget, the limit holds
+    run(governor, clock, monkeypatch, 90, 30)
+    assert governor() == 4
+    # One task at once, then one per cooldown
+    run(governor, clock, monkeypatch, 50, 12)
+    assert governor() == 7
+    run(governor, clock, monkeypatch, 50, 60)
+    assert governor() == 8
@@ -0,0 +1,18 @@
+from collections import Counter
+from metrics import Metrics, prometheus_text
+
+
+def test_worker_seconds_are_kept_apart_from_the_stages():
+    metrics = Metrics()
+    metrics.add_time('score', 2.0)
+    # Two workers busy over the same two seconds
+    metrics.add(Counter({'seconds:worker:score': 1.9, 'scored': 10}))
+    metrics.add(Counter({'seconds:worker:score': 2.0, 'scored': 5, 'seconds:batch_fuzz': 0.5, 'calls:batch_fuzz': 15}))
+    snapshot = metrics.snapshot()
+    assert snapshot['stages'] == {'score': 2.0}
+    assert snapshot['worker_seconds'] == {'score': 3.9}
+    assert snapshot['counters'] == {'scored': 15}
+    assert snapshot['scorers'] == {'batch_fuzz': {'calls': 15, 'seconds': 0.5}}
+    text = prometheus_text(snapshot)
+    assert 'enterprise_finder_stage_seconds{stage="score"} 2.0\n' in text
+    assert 'enterprise_finder_worker_seconds_total{stage="score"} 3.9\n' in text
@@ -0,0 +1,30 @@
+import pandas as pd
+import pytest
+from name_normalizer import canonical_key, canonical_keys, exact_join
+
+
+@pytest.mark.parametrize("name, key", [
+    ("Sté Dupont & Fils, S.A.R.L.", "DUPONT FILS"),
+    ("DUPONT FILS", "DUPONT FILS"),
+    ("STE. DUPONT", "DUPONT"),
+    ("  enrobes réunion ", "ENROBES REUNION"),
+    ("E.I. ANALYSE BTP", "ANALYSE BTP"),
+    ("EURL ARC-EN-CIEL", "ARC EN CIEL"),
+    ("Œuvre", "OEUVRE"),
+    ("OEUVRE", "OEUVRE"),
+    ("SOCIÉTÉ LÆTITIA", "LAETITIA"),
+    ("Ste-Marie BTP", "STE MARIE BTP"),
+    ("BTP STE MARIE", "BTP STE MARIE"),
+    ("SARL", ""),
+])
+def test_canonical_key(name, key):
+    assert canonical_key(name) == key
+
+def test_canonical_keys_of_missing_names():
+    assert canonical_keys(pd.Series(["Sarl Dupont", None, "DUPONT"])).tolist() == ["DUPONT", "", "DUPONT"]
+
+def test_exact_join():
+    good = pd.Series(["OEUVRE SAS", "Ste-Marie BTP", "MARIE BTP", None, "SARL"])
+    bad = pd.Series(["Œuvre", "STE-MARIE B.T.P.", "Sté Marie BTP", None, "EURL"])
+    pairs = exact_join(good, bad)
+    assert list(pairs.itertuples(index=False, name=None)) == [(0, 0), (1, 1), (2, 2)]
@@ -0,0 +1,67 @@
+import csv
+import threading
+import pytest
+from output_sink import OutputSink
+
+HEADER = ['name', 'score']
+
+
+class FullDisk:
+    def writerows(self, rows):
+        raise OSError(28, "No space left on device")
+
+
+def read(category):
+    with open(f'{category}.csv', newline='') as csv_file:
+        return list(csv.reader(csv_file))
+
+def in_threads(*calls):
+    """Runs every call at once, one thread each, and returns the exceptions they raised, failing if one still blocks after 5 s."""
+    raised = [None] * len(calls)
+    def run(position):
+        try:
+            calls[position]()
+        except BaseException as error:
+            raised[position] = error
+    threads = [threading.Thread(target=run, args=(position,), daemon=True) for position in range(len(calls))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+        assert not thread.is_alive(), "blocked on a dead writer thread"
+    return raised
+
+def in_thread(call):
+    return in_threads(call)[0]
+
+def test_rows_are_written_per_category(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with OutputSink(['valid', 'no_chance'], HEADER, batch_size=2) as sink:
+        sink.put('valid', ['DUPONT', '0.9'])
+        sink.put_many([('no_chance', ['MARTIN', '0.1']), ('valid', ['DURAND', '0.8']), ('valid', ['PETIT', '0.7'])])
+        sink.flush()
+        assert read('valid') == [HEADER, ['DUPONT', '0.9'], ['DURAND', '0.8'], ['PETIT', '0.7']]
+    assert read('no_chance') == [HEADER, ['MARTIN', '0.1']]
+
+def test_unknown_category_fails_flush_put_and_close(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sink = OutputSink(['valid'], HEADER)
+    sink.start()
+    sink.put(None, ['DUPONT', '0.9'])
+    assert isinstance(in_thread(sink.flush), KeyError)
+    with pytest.raises(KeyError):
+        sink.put('valid', ['DURAND', '0.8'])
+    with pytest.raises(KeyError):
+        sink.put_many([('valid', ['DURAND', '0.8'])])
+    assert isinstance(in_thread(sink.close), KeyError)
+
+def test_write_error_releases_waiting_flushes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sink = OutputSink(['valid'], HEADER, batch_size=1)
+    sink.start()
+    sink._writers['valid'] = FullDisk()
+    sink.put('valid', ['DUPONT', '0.9'])
+    # Flushes queued with the failing batch, and one after the failure
+    errors = in_threads(sink.flush, sink.flush, sink.flush) + [in_thread(sink.flush)]
+    assert all(isinstance(error, OSError) and error.errno == 28 for error in errors)
+    assert isinstance(in_thread(sink.close), OSError)
@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+import phonetic_blocking
+from name_store import NameStore
+from phonetic_blocking import PhoneticIndex, neighbour_keys, phonetic_code, phonetic_key
+
+
+@pytest.mark.parametrize("names, key", [
+    (["PHARMACIE", "FARMASSIE", "Pharmacie"], "FLNK"),
+    (["PHILIPPE", "FILIPE", "PHILIPE"], "FLP"),
+    (["CHAUFFAGE MARTIN", "CHOFAJE MARTEN", "SHAUFAGE MARTAIN"], "KFKNLKN"),
+    (["CARROSSERIE", "KAROSSERIE", "CAROSSERIE"], "KLKL"),
+    (["QUINCAILLERIE", "KINKAILLERIE", "QUINCAILLERY"], "KNKL"),
+    (["DUPONT", "DUPOND", "DUPONS"], "KPNK"),
+    (["SARL DUPONT", "DUPONT SAS", "SERL DUPANT", "Sté Dupont"], "KPNK"),
+])
+def test_homophones_share_a_key(names, key):
+    assert [phonetic_key(name) for name in names] == [key] * len(names)
+
+def test_digits_are_kept_apart_from_codes():
+    assert phonetic_key("H2T") == "2K"
+    assert phonetic_code("AIE") == "A"
+
+def test_legal_forms_alone_are_kept():
+    assert phonetic_key("SCI SA") == ""
+    assert phonetic_key("SCOP EURL") == ""
+    assert phonetic_key("DE LA") == phonetic_code("DE") + phonetic_code("LA")
+
+def test_every_rewrite_changes_a_key(monkeypatch):
+    words = {('PH', 'F'): "PHARMACIE"}
+    for rule in phonetic_blocking.REWRITES:
+        expected = phonetic_code(words[rule])
+        monkeypatch.setattr(phonetic_blocking, 'REWRITES', tuple(r for r in phonetic_blocking.REWRITES if r != rule))
+        assert phonetic_code(words[rule]) != expected
+        monkeypatch.undo()
+
+def test_neighbour_keys():
+    assert neighbour_keys("KNK", 0) == {"KNK"}
+    assert neighbour_keys("KNK") == {"KNK", "NK", "KK", "KN"}
+
+def test_index_buckets():
+    good = pd.DataFrame({'CT_Intitule': ["THOMAS", "PHARMACIE DU PORT", "DUPONT SARL", "THOMAS"],
+                         'CT_Num': ["G0", "G1", "G2", "G3"]})
+    store = NameStore.build(good, ['CT_Num', 'CT_Intitule'])
+    assert sorted(PhoneticIndex(store, 0).candidates("FARMASSIE DU PORT")) == [1]
+    assert sorted(PhoneticIndex(store, 0).candidates("TOMA")) == []
+    assert sorted(PhoneticIndex(store, 1).candidates("TOMA")) == [0, 3]
+    assert sorted(PhoneticIndex(store, 0).candidates("SAS DUPOND")) == [2]
+    # KPNK with its P deleted is the KNK of THOMAS
+    assert sorted(PhoneticIndex(store, 1).candidates("SAS DUPOND")) == [0, 2, 3]
@@ -0,0 +1,19 @@
+import pandas as pd
+from siret_classifier import SiretClassifier, classify_sirets
+
+SIRETS = ['73282932000074', '732 829 320 00074', None, '', '  ', 'ABC', '552100554', '12345678901234',
+          '552100554', '73282932000074', '1234567890', '55210055400013']
+LABELS = ['good', 'dup', 'empty', 'empty', 'empty', 'bad', 'good', 'good', 'dup', 'dup', 'bad', 'good']
+
+
+def test_classify_sirets():
+    assert classify_sirets(SIRETS).tolist() == LABELS
+
+def test_chunks_get_the_labels_of_one_call():
+    whole = classify_sirets(SIRETS)
+    for size in (1, 2, 5):
+        classifier = SiretClassifier()
+        labels = pd.concat([classifier.classify(SIRETS[start:start + size])[0]
+                            for start in range(0, len(SIRETS), size)], ignore_index=True)
+        assert labels.tolist() == whole.tolist()
+        assert classifier.seen == {'73282932000074', '552100554', '12345678901234', '55210055400013'}
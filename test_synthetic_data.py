@@ -0,0 +1,15 @@
+import os
+import pandas as pd
+from synthetic_data import generate
+from siret_classifier import classify_sirets
+
+
+def test_generate_creates_the_output_dir(tmp_path):
+    output_dir = tmp_path / 'nested' / 'synthetic'
+    written = generate(str(output_dir), 1000, seed=1, chunk_size=300)
+    assert written['good'] + written['dup'] + written['bad'] == 1000
+    for name in ('good', 'dup', 'bad'):
+        frame = pd.read_csv(os.path.join(output_dir, f'client_{name}_siret.csv'), dtype=str)
+        assert len(frame) == written[name]
+    good = pd.read_csv(os.path.join(output_dir, 'client_good_siret.csv'), dtype=str)
+    assert (classify_sirets(good['CT_Siret']) == 'good').all()